@@ -0,0 +1,632 @@
+"""Benchmarks for serpextract.  Each benchmark is a sub-command, e.g.::
+
+    $ python benchmark.py -n 20000 oracle
+
+Referrers are generated with :func:`tests.oracle.generate_referrers` so runs
+are reproducible for a given ``--seed``.
+"""
+import argparse
+import time
+
+from tests import oracle
+import serpextract.serpextract as serpextract
+
+
+def _rate(count, seconds):
+    if seconds <= 0:
+        return float('inf')
+    return count / seconds
+
+
+def _timeit(func, *args, **kwargs):
+    start = time.time()
+    res = func(*args, **kwargs)
+    return res, time.time() - start
+
+
+def bench_oracle(args):
+    """Diff every entry point against the reference oracle and report
+    throughput alongside mismatches."""
+    urls = oracle.generate_referrers(args.number, seed=args.seed)
+    reports = oracle.compare(urls)
+    print '{:<32}{:>10}{:>14}{:>14}{:>10}{:>12}'.format(
+        'Entry point', 'Calls', 'Oracle url/s', 'Current url/s', 'Speedup',
+        'Mismatches')
+    failed = False
+    for report in reports:
+        ref_rate = _rate(report['calls'], report['reference_seconds'])
+        cand_rate = _rate(report['calls'], report['candidate_seconds'])
+        print '{:<32}{:>10}{:>14.0f}{:>14.0f}{:>9.2f}x{:>12}'.format(
+            report['name'], report['calls'], ref_rate, cand_rate,
+            cand_rate / ref_rate, len(report['mismatches']))
+        for url, expected, actual in report['mismatches'][:args.show]:
+            failed = True
+            print '    {!r}\n        expected: {!r}\n        actual:   {!r}'.format(
+                url, expected, actual)
+    return 1 if failed else 0
+
+
+def _skewed_referrers(count, seed, hot=50, sample_seed=None):
+    """Referrers where most traffic comes from a few hot URLs, as in real
+    traffic, with the long tail drawn from the oracle corpus.  Pass a
+    ``sample_seed`` to draw a different stream from the same URLs."""
+    import random
+    rng = random.Random(seed if sample_seed is None else sample_seed)
+    corpus = oracle.generate_referrers(max(count // 10, hot), seed=seed)
+    hot_urls = corpus[:hot]
+    return [rng.choice(hot_urls) if rng.random() < 0.9 else rng.choice(corpus)
+            for _ in range(count)]
+
+
+def bench_lookup(args):
+    """Compare adaptive and fixed-precedence get_parser lookups on skewed
+    traffic."""
+    urls = _skewed_referrers(args.number, args.seed)
+    fixed = lambda url: serpextract.get_parser(url, adaptive=False)
+    for name, func in (('fixed', fixed), ('adaptive', serpextract.get_parser)):
+        _, secs = _timeit(map, func, urls)
+        print '{:<10}{:>12.0f} url/s'.format(name, _rate(len(urls), secs))
+    print 'Lookups by tier: {}'.format(serpextract.get_lookup_stats())
+    return 0
+
+
+def bench_batch(args):
+    """Compare extract() per referrer with host-grouped extract_batch() on
+    skewed traffic."""
+    urls = _skewed_referrers(args.number, args.seed)
+    _, secs = _timeit(map, serpextract.extract, urls)
+    print '{:<16}{:>12.0f} url/s'.format('extract', _rate(len(urls), secs))
+    plan, plan_secs = _timeit(serpextract.BatchPlan, urls)
+    _, secs = _timeit(plan.extract)
+    print '{:<16}{:>12.0f} url/s'.format('extract_batch',
+                                         _rate(len(urls), plan_secs + secs))
+    print 'Dedupe ratio: {:.1f} referrers per lookup'.format(plan.dedupe_ratio)
+    return 0
+
+
+def _deep_sizeof(obj, seen):
+    """Approximate size in bytes of ``obj`` and everything it references,
+    counting shared objects once."""
+    import sys
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.iteritems():
+            size += _deep_sizeof(key, seen) + _deep_sizeof(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += _deep_sizeof(item, seen)
+    elif hasattr(obj, '__slots__'):
+        for attr in obj.__slots__:
+            size += _deep_sizeof(getattr(obj, attr, None), seen)
+    elif hasattr(obj, 'pattern'):
+        size += _deep_sizeof(obj.pattern, seen)
+    return size
+
+
+def bench_engines(args):
+    """Compare the size and build time of the engine table with and without
+    shared parsers."""
+    serpextract._get_piwik_engines()  # Warm up the pickle read
+    for name, module in (('per-rule', oracle), ('shared', serpextract)):
+        secs = []
+        for _ in range(args.repeat):
+            module._engines = None
+            engines, elapsed = _timeit(module._get_search_engines)
+            secs.append(elapsed)
+        parsers = set(id(parser) for parser in engines.itervalues())
+        print '{:<10}{:>6} rules{:>6} parsers{:>10} bytes{:>9.2f} ms'.format(
+            name, len(engines), len(parsers), _deep_sizeof(engines, set()),
+            min(secs) * 1000)
+    return 0
+
+
+def bench_urlsplit(args):
+    """Compare urlparse.urlparse with serpextract's specialized URL
+    splitter on unique referrers."""
+    from urlparse import urlparse
+    urls = [url.decode('utf-8', 'ignore') if isinstance(url, str) else url
+            for url in oracle.generate_referrers(args.number, seed=args.seed)]
+    urls = [url for url in set(urls) if url.startswith(('http://', 'https://'))
+            and '[' not in url and ']' not in url]
+    for name, func in (('urlparse', urlparse),
+                       ('_split_url', serpextract._split_url)):
+        _, secs = _timeit(map, func, urls)
+        print '{:<12}{:>12.0f} url/s'.format(name, _rate(len(urls), secs))
+    return 0
+
+
+def bench_logs(args):
+    """Compare pulling referrers out of combined format log lines with a
+    full-line regex against the log adapters, with and without extraction."""
+    import re
+    from serpextract import logs
+    line_fmt = ('66.249.66.1 - - [10/Oct/2013:13:55:36 -0700] "GET '
+                '/articles/{} HTTP/1.1" 200 2326 "{}" "Mozilla/5.0 (Windows NT '
+                '6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) '
+                'Chrome/30.0.1599.101 Safari/537.36"\n')
+    urls = _skewed_referrers(args.number, args.seed)
+    lines = [line_fmt.format(i, url.encode('utf-8') if isinstance(url, unicode)
+                                else url)
+             for i, url in enumerate(urls)]
+    combined_re = re.compile(
+        r'^(?P<host>\S+) (?P<ident>\S+) (?P<user>\S+) \[(?P<time>[^\]]+)\] '
+        r'"(?P<request>(?:[^"\\]|\\.)*)" (?P<status>\d{3}) (?P<size>\S+) '
+        r'"(?P<referrer>(?:[^"\\]|\\.)*)" "(?P<agent>(?:[^"\\]|\\.)*)"')
+    regex_referrers = lambda lines: [combined_re.match(line).group('referrer')
+                                     for line in lines]
+    adapter_referrers = lambda lines: list(logs.combined_referrers(lines))
+
+    for name, func in (('regex', regex_referrers),
+                       ('adapter', adapter_referrers)):
+        _, secs = _timeit(func, lines)
+        print '{:<28}{:>12.0f} lines/s'.format(name + ' referrer only',
+                                               _rate(len(lines), secs))
+
+    regex_extract = lambda lines: map(serpextract.extract,
+                                      regex_referrers(lines))
+    adapter_extract = lambda lines: list(logs.extract_referrers(
+                                         logs.combined_referrers(lines)))
+    for name, func in (('regex + extract', regex_extract),
+                       ('adapter + extract_batch', adapter_extract)):
+        _, secs = _timeit(func, lines)
+        print '{:<28}{:>12.0f} lines/s'.format(name, _rate(len(lines), secs))
+    return 0
+
+
+def bench_is_serp(args):
+    """Compare classifying referrers by full extraction with is_serp() and
+    is_serp_batch() on skewed traffic."""
+    urls = _skewed_referrers(args.number, args.seed)
+    by_extract = lambda urls: [serpextract.extract(url) is not None
+                               for url in urls]
+    by_is_serp = lambda urls: map(serpextract.is_serp, urls)
+    for name, func in (('extract', by_extract), ('is_serp', by_is_serp),
+                       ('is_serp_batch', serpextract.is_serp_batch)):
+        _, secs = _timeit(func, urls)
+        print '{:<16}{:>12.0f} url/s'.format(name, _rate(len(urls), secs))
+    return 0
+
+
+def bench_limits(args):
+    """Show that set_limits() bounds the worst-case cost of pathological
+    referrers."""
+    normal = 'http://www.google.com/search?q=hello+world&ie=utf-8'
+    pathological = (
+        ('normal', normal),
+        ('2MB keyword', 'http://www.google.com/search?q=' + 'a+' * 1000000),
+        ('50k params', 'http://www.google.com/search?' +
+                       '&'.join('p{}=x'.format(i) for i in range(50000)) +
+                       '&q=hello'),
+        ('4k params', 'http://www.google.com/search?' + 'p&' * 4000 +
+                      'q=hello'),
+        ('1MB host', 'http://' + 'a' * 1000000 + '.com/search?q=hello'),
+        ('garbage host', 'http://' + 'a b' * 2000 + '/search?q=hello'),
+    )
+    limits = dict(max_url_length=8192, max_query_params=256,
+                  max_keyword_length=256, validate_host=True)
+    print '{:<14}{:>14}{:>14}'.format('Referrer', 'No limits', 'Limits')
+    for name, url in pathological:
+        timings = []
+        for limit in ({}, limits):
+            serpextract.set_limits(**limit)
+            secs = min(_timeit(serpextract.extract, url)[1] for _ in range(5))
+            timings.append(secs * 1000)
+        print '{:<14}{:>11.3f} ms{:>11.3f} ms'.format(name, *timings)
+    serpextract.set_limits()
+    print 'Rejections: {}'.format(serpextract.get_rejection_stats())
+    return 0
+
+
+def bench_pickle(args):
+    """Compare bytes and time per million results for pickling results the
+    old way (with full parsers), by engine id, and with dump_results()."""
+    import cPickle
+    urls = _skewed_referrers(args.number, args.seed)
+    old = [oracle.extract(url) for url in urls]
+    new = serpextract.extract_batch(urls)
+    scale = 1000000.0 / len(urls)
+
+    def pickler(protocol):
+        return (lambda results: cPickle.dumps(results, protocol),
+                cPickle.loads)
+
+    encodings = (
+        ('full parsers, protocol 2', old) + pickler(2),
+        ('engine ids, protocol 0', new) + pickler(0),
+        ('engine ids, protocol 2', new) + pickler(2),
+        ('dump_results', new, serpextract.dump_results,
+         serpextract.load_results),
+    )
+    print '{:<28}{:>14}{:>12}{:>12}'.format('Encoding', 'MB/million',
+                                            'Dump s/M', 'Load s/M')
+    for name, results, dump, load in encodings:
+        data, dump_secs = _timeit(dump, results)
+        _, load_secs = _timeit(load, data)
+        print '{:<28}{:>14.1f}{:>12.2f}{:>12.2f}'.format(
+            name, len(data) * scale / 1e6, dump_secs * scale,
+            load_secs * scale)
+    return 0
+
+
+def bench_cache(args):
+    """Compare a backfill pass with extract_batch() against a first (cold)
+    and second (warm) pass through a persistent ResultCache."""
+    import os
+    import shutil
+    import tempfile
+    from serpextract.cache import ResultCache
+    urls = _skewed_referrers(args.number, args.seed)
+    batches = [urls[i:i + 1000] for i in xrange(0, len(urls), 1000)]
+    tempdir = tempfile.mkdtemp()
+    filename = os.path.join(tempdir, 'cache.db')
+    try:
+        _, secs = _timeit(lambda: [serpextract.extract_batch(batch)
+                                   for batch in batches])
+        print '{:<16}{:>12.0f} url/s'.format('extract_batch',
+                                             _rate(len(urls), secs))
+        for name in ('cold cache', 'warm cache'):
+            with ResultCache(filename) as cache:
+                _, secs = _timeit(lambda: [cache.extract_batch(batch)
+                                           for batch in batches])
+                print '{:<16}{:>12.0f} url/s'.format(name,
+                                                     _rate(len(urls), secs))
+        print 'Cache stats: {}, {} bytes'.format(cache.get_stats(),
+                                                 os.path.getsize(filename))
+    finally:
+        shutil.rmtree(tempdir)
+    return 0
+
+
+def bench_wildcards(args):
+    """Compare get_parser() throughput, and a linear scan of the same rules,
+    as thousands of custom wildcard rules are added."""
+    urls = _skewed_referrers(args.number, args.seed)
+    url_parts = [serpextract._unicode_urlparse(url) for url in urls]
+    # The linear scan is quadratic so it only gets a sample
+    url_parts = [parts for parts in url_parts if parts is not None][:1000]
+    parser = serpextract.SearchEngineParser(u'Wildcard', u'q', None, u'utf-8')
+    rules = []
+
+    def linear_scan(url_parts):
+        for parts in url_parts:
+            query = serpextract._serp_query_string(parts)
+            for rule in rules:
+                if rule[0] == u'?' and query.startswith(rule[1:-1]) or \
+                        rule[0] == u'/' and parts.path.startswith(rule[:-1]) or \
+                        rule[0] == u'*' and rule[1:] in parts.netloc:
+                    break
+
+    fixed = lambda url: serpextract.get_parser(url, adaptive=False)
+    print '{:>8}{:>16}{:>16}{:>16}'.format('Rules', 'Adaptive url/s',
+                                           'Fixed url/s', 'Linear url/s')
+    for count in (0, 10, 100, 1000, 10000):
+        while len(rules) < count:
+            # Vary the pattern lengths as real rules would
+            i = len(rules)
+            rule = (u'*.{}.wild{}.example'.format(u'x' * (i % 7), i),
+                    u'/wild{}/{}*'.format(i, u'y' * (i % 5)),
+                    u'?wild{}={}*'.format(i, u'z' * (i % 3)))[i % 3]
+            serpextract.add_custom_parser(rule, parser)
+            rules.append(rule)
+        map(serpextract.get_parser, urls)  # Build the lookup plans
+        rates = []
+        for func in (serpextract.get_parser, fixed):
+            _, secs = _timeit(map, func, urls)
+            rates.append(_rate(len(urls), secs))
+        _, secs = _timeit(linear_scan, url_parts)
+        rates.append(_rate(len(url_parts), secs))
+        print '{:>8}{:>16.0f}{:>16.0f}{:>16.0f}'.format(count, *rates)
+    return 0
+
+
+def bench_profile(args):
+    """Compare the size, load time and get_parser() throughput of the full
+    engine table against an engine profile recorded from the same traffic,
+    with and without falling back to the full table."""
+    import os
+    import shutil
+    import tempfile
+    urls = _skewed_referrers(args.number, args.seed)
+    misses = ['http://www.example{}.com/search?q=test'.format(i % 1000)
+              for i in xrange(len(urls))]
+    tempdir = tempfile.mkdtemp()
+    filename = os.path.join(tempdir, 'profile.json')
+    try:
+        before = serpextract.get_rule_stats()
+        map(serpextract.get_parser, urls)
+        rule_hits = dict((rule, hits - before.get(rule, 0))
+                         for rule, hits in serpextract.get_rule_stats().items())
+        serpextract.save_engine_profile(filename, args.min_hits, rule_hits)
+
+        def load_full():
+            serpextract.unload_engine_profile()
+            return serpextract._get_search_engines()
+
+        def load_profile(fallback=False):
+            serpextract.load_engine_profile(filename, fallback)
+            return serpextract._get_search_engines()
+
+        print '{:<18}{:>8}{:>10}{:>10}{:>12}{:>12}'.format(
+            'Table', 'Rules', 'Bytes', 'Load ms', 'Hit url/s', 'Miss url/s')
+        for name, load in (('full', load_full),
+                           ('profile', load_profile),
+                           ('profile+fallback', lambda: load_profile(True))):
+            secs = []
+            for _ in range(args.repeat):
+                engines, elapsed = _timeit(load)
+                secs.append(elapsed)
+            rates = []
+            for stream in (urls, misses):
+                map(serpextract.get_parser, stream)  # Build the lookup plans
+                _, elapsed = _timeit(map, serpextract.get_parser, stream)
+                rates.append(_rate(len(stream), elapsed))
+            print '{:<18}{:>8}{:>10}{:>10.2f}{:>12.0f}{:>12.0f}'.format(
+                name, len(engines), _deep_sizeof(engines, set()),
+                min(secs) * 1000, *rates)
+    finally:
+        serpextract.unload_engine_profile()
+        shutil.rmtree(tempdir)
+    return 0
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def bench_pipeline(args):
+    """Compare throughput and per-referrer latency of extracting a stream
+    from a fake producer inline, in a worker thread and in worker processes,
+    unthrottled and at a fixed rate."""
+    from multiprocessing import Pool
+    from serpextract.logs import extract_referrers
+    from serpextract.pipeline import imap_extract
+    urls = _skewed_referrers(args.number, args.seed)
+    produced = [0.0] * len(urls)
+
+    def producer(rate):
+        # Bursts of 100 referrers at ``rate`` referrers per second, like
+        # reads off a socket
+        start = time.time()
+        for i, url in enumerate(urls):
+            if rate and i % 100 == 0:
+                delay = start + float(i) / rate - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            produced[i] = time.time()
+            yield url
+
+    pool = Pool(args.workers)
+    modes = (
+        ('inline', lambda referrers: extract_referrers(referrers,
+                                                       args.chunk_size)),
+        ('1 thread', lambda referrers: imap_extract(
+            referrers, chunk_size=args.chunk_size)),
+        ('{} processes'.format(args.workers), lambda referrers: imap_extract(
+            referrers, pool, chunk_size=args.chunk_size)),
+    )
+    try:
+        print '{:<14}{:>12}{:>12}{:>12}{:>12}'.format(
+            'Mode', 'Rate', 'url/s', 'p50 ms', 'p99 ms')
+        for rate in (0, args.rate):
+            for name, imap in modes:
+                latencies = []
+                start = time.time()
+                for i, _ in enumerate(imap(producer(rate))):
+                    latencies.append(time.time() - produced[i])
+                secs = time.time() - start
+                print '{:<14}{:>12}{:>12.0f}{:>12.1f}{:>12.1f}'.format(
+                    name, rate or 'max', _rate(len(urls), secs),
+                    _percentile(latencies, 0.5) * 1000,
+                    _percentile(latencies, 0.99) * 1000)
+    finally:
+        pool.terminate()
+    return 0
+
+
+def bench_links(args):
+    """Compare building SERP links row by row with get_serp_url(), with and
+    without percent-encoding, against get_serp_urls()."""
+    from urllib import quote_plus
+    urls = _skewed_referrers(args.number, args.seed)
+    rows = []
+    for url, res in zip(urls, serpextract.extract_batch(urls)):
+        if res is not None and res.parser.link_macro is not None:
+            parts = serpextract._unicode_urlparse(url)
+            rows.append((res.parser, u'{}://{}'.format(parts.scheme,
+                                                       parts.netloc),
+                         res.keyword))
+    parsers, base_urls, keywords = zip(*rows)
+
+    def encoded(parser, base_url, keyword):
+        try:
+            keyword = keyword.encode(parser.charsets[0])
+        except (UnicodeEncodeError, LookupError):
+            keyword = keyword.encode('utf-8')
+        return parser.get_serp_url(base_url, quote_plus(keyword, safe=''))
+
+    print '{:<22}{:>12}'.format('{} rows'.format(len(rows)), 'rows/s')
+    for name, func in (
+            ('get_serp_url', lambda: [parser.get_serp_url(base_url, keyword)
+                                      for parser, base_url, keyword in rows]),
+            ('get_serp_url+quote', lambda: [encoded(*row) for row in rows]),
+            ('get_serp_urls', lambda: serpextract.get_serp_urls(
+                parsers, base_urls, keywords))):
+        _, secs = _timeit(func)
+        print '{:<22}{:>12.0f}'.format(name, _rate(len(rows), secs))
+    return 0
+
+
+def _lru_extract_batch(lru, urls):
+    """extract_batch() through a per-process LRU cache of results."""
+    results = [None] * len(urls)
+    misses = []
+    for i, url in enumerate(urls):
+        try:
+            results[i] = lru[url]
+        except KeyError:
+            misses.append(i)
+    fresh = serpextract.extract_batch([urls[i] for i in misses])
+    for i, result in zip(misses, fresh):
+        lru[urls[i]] = results[i] = result
+    return results, len(urls) - len(misses), len(misses)
+
+
+def _shared_worker(mode, filename, slots, count, seed, worker, queue):
+    import pylru
+    from serpextract.cache import SharedResultCache
+    # Every worker sees the same hot and long tail referrers
+    urls = _skewed_referrers(count, seed, hot=500,
+                             sample_seed=(seed, worker))
+    batches = [urls[i:i + 1000] for i in xrange(0, len(urls), 1000)]
+    hits = misses = 0
+    if mode == 'per-process':
+        lru = pylru.lrucache(slots)
+        for batch in batches:
+            _, batch_hits, batch_misses = _lru_extract_batch(lru, batch)
+            hits += batch_hits
+            misses += batch_misses
+    else:
+        with SharedResultCache(filename, slots=slots) as cache:
+            for batch in batches:
+                cache.extract_batch(batch)
+            stats = cache.get_stats()
+            hits, misses = stats['hits'], stats['misses']
+    queue.put((hits, misses))
+
+
+def bench_shared(args):
+    """Compare aggregate hit rate and throughput of worker processes with
+    per-process LRU caches against one SharedResultCache."""
+    import os
+    import shutil
+    import tempfile
+    import multiprocessing
+    from serpextract.cache import SharedResultCache
+    tempdir = tempfile.mkdtemp(dir='/dev/shm' if os.path.isdir('/dev/shm')
+                               else None)
+    filename = os.path.join(tempdir, 'shared.cache')
+    count = args.number // args.workers
+    serpextract._get_search_engines()  # Load before forking
+    print '{:<14}{:>10}{:>14}'.format('Caches', 'Hit rate', 'Total url/s')
+    try:
+        for mode in ('per-process', 'shared'):
+            queue = multiprocessing.Queue()
+            workers = [multiprocessing.Process(
+                           target=_shared_worker,
+                           args=(mode, filename, args.slots, count,
+                                 args.seed, i, queue))
+                       for i in xrange(args.workers)]
+            start = time.time()
+            for worker in workers:
+                worker.start()
+            totals = [queue.get() for _ in workers]
+            for worker in workers:
+                worker.join()
+            secs = time.time() - start
+            hits = sum(hits for hits, _ in totals)
+            misses = sum(misses for _, misses in totals)
+            print '{:<14}{:>9.1f}%{:>14.0f}'.format(
+                mode, 100.0 * hits / (hits + misses),
+                _rate(hits + misses, secs))
+
+        with SharedResultCache(filename) as cache:
+            print 'Shared cache workers:'
+            for stats in cache.get_worker_stats():
+                if stats['pid'] != os.getpid():
+                    print '  {pid}: {hits} hits, {misses} misses, ' \
+                          '{stores} stores'.format(**stats)
+    finally:
+        shutil.rmtree(tempdir)
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='serpextract benchmarks.')
+    parser.add_argument('-n', '--number', type=int, default=20000,
+                        help='Number of referrers to generate.')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Seed used to generate referrers.')
+    subparsers = parser.add_subparsers()
+
+    oracle_parser = subparsers.add_parser('oracle', help=bench_oracle.__doc__)
+    oracle_parser.add_argument('--show', type=int, default=5,
+                               help='Number of mismatches to print per entry '
+                                    'point.')
+    oracle_parser.set_defaults(func=bench_oracle)
+
+    lookup_parser = subparsers.add_parser('lookup', help=bench_lookup.__doc__)
+    lookup_parser.set_defaults(func=bench_lookup)
+
+    batch_parser = subparsers.add_parser('batch', help=bench_batch.__doc__)
+    batch_parser.set_defaults(func=bench_batch)
+
+    engines_parser = subparsers.add_parser('engines',
+                                           help=bench_engines.__doc__)
+    engines_parser.add_argument('--repeat', type=int, default=20,
+                                help='Number of times to build each table.')
+    engines_parser.set_defaults(func=bench_engines)
+
+    urlsplit_parser = subparsers.add_parser('urlsplit',
+                                            help=bench_urlsplit.__doc__)
+    urlsplit_parser.set_defaults(func=bench_urlsplit)
+
+    logs_parser = subparsers.add_parser('logs', help=bench_logs.__doc__)
+    logs_parser.set_defaults(func=bench_logs)
+
+    is_serp_parser = subparsers.add_parser('is_serp',
+                                           help=bench_is_serp.__doc__)
+    is_serp_parser.set_defaults(func=bench_is_serp)
+
+    limits_parser = subparsers.add_parser('limits', help=bench_limits.__doc__)
+    limits_parser.set_defaults(func=bench_limits)
+
+    pickle_parser = subparsers.add_parser('pickle', help=bench_pickle.__doc__)
+    pickle_parser.set_defaults(func=bench_pickle)
+
+    cache_parser = subparsers.add_parser('cache', help=bench_cache.__doc__)
+    cache_parser.set_defaults(func=bench_cache)
+
+    wildcards_parser = subparsers.add_parser('wildcards',
+                                             help=bench_wildcards.__doc__)
+    wildcards_parser.set_defaults(func=bench_wildcards)
+
+    profile_parser = subparsers.add_parser('profile',
+                                           help=bench_profile.__doc__)
+    profile_parser.add_argument('--repeat', type=int, default=20,
+                                help='Number of times to load each table.')
+    profile_parser.add_argument('--min-hits', type=int, default=10,
+                                help='Leave rules with fewer hits out of the '
+                                     'profile.')
+    profile_parser.set_defaults(func=bench_profile)
+
+    pipeline_parser = subparsers.add_parser('pipeline',
+                                            help=bench_pipeline.__doc__)
+    pipeline_parser.add_argument('-w', '--workers', type=int, default=4,
+                                 help='Number of worker processes.')
+    pipeline_parser.add_argument('--chunk-size', type=int, default=1000,
+                                 help='Referrers per chunk.')
+    pipeline_parser.add_argument('--rate', type=int, default=20000,
+                                 help='Referrers per second for the '
+                                      'throttled runs.')
+    pipeline_parser.set_defaults(func=bench_pipeline)
+
+    links_parser = subparsers.add_parser('links', help=bench_links.__doc__)
+    links_parser.set_defaults(func=bench_links)
+
+    shared_parser = subparsers.add_parser('shared', help=bench_shared.__doc__)
+    shared_parser.add_argument('-w', '--workers', type=int, default=4,
+                               help='Number of worker processes.')
+    shared_parser.add_argument('--slots', type=int, default=4096,
+                               help='Results per cache.')
+    shared_parser.set_defaults(func=bench_shared)
+
+    args = parser.parse_args()
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,657 @@
+"""Caches of :func:`serpextract.extract` results which outlive a process.
+
+:class:`ResultCache` is a persistent on-disk cache, so that re-running a
+backfill over the same referrers is mostly cache reads::
+
+    from serpextract.cache import ResultCache
+
+    with ResultCache('referrers.db') as cache:
+        results = cache.extract_batch(referrers)
+
+:class:`SharedResultCache` is a fixed-size cache in shared memory which every
+worker process on a host can use, so that hot referrers are only extracted
+once per host rather than once per worker.
+
+Entries are keyed by a hash of the referrer, the version of the search engine
+definitions (see :func:`serpextract.serpextract._get_engines_version`), the
+keyword normalization flags and any limits set with
+:func:`serpextract.set_limits`, so a cache never returns a result that
+:func:`serpextract.extract` wouldn't.  Entries written for an older version of
+``search_engines.pickle`` are dropped when the cache is opened.
+"""
+import os
+import mmap
+import time
+import fcntl
+import struct
+import hashlib
+import logging
+import marshal
+import sqlite3
+from contextlib import contextmanager
+from urlparse import ParseResult
+
+from . import serpextract
+
+
+__all__ = ('ResultCache', 'SharedResultCache')
+
+log = logging.getLogger('serpextract')
+
+# SQLite's default limit on the number of host parameters in a statement is
+# 999
+_chunk_size = 500
+
+# Granularity of the last used time of entries, in seconds.  Hits only
+# rewrite entries that haven't been used in this long.
+_used_resolution = 3600
+
+
+def _chunks(seq, size):
+    for i in xrange(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+def _key_prefix(version, kwargs):
+    """
+    The part of every cache key that depends on the search engine
+    definitions ``version``, the normalization flags in ``kwargs`` and the
+    current limits rather than the referrer.
+    """
+    flags = (kwargs.get('lower_case', True), kwargs.get('trimmed', True),
+             kwargs.get('collapse_whitespace', True),
+             kwargs.get('use_naive_method', False))
+    limits = sorted(serpextract.get_limits().iteritems())
+    return repr((version, flags, limits))
+
+
+def _url_keys(prefix, serp_urls):
+    """Return a 16 byte cache key for each of ``serp_urls``."""
+    keys = []
+    for url in serp_urls:
+        if isinstance(url, ParseResult):
+            url = url.geturl()
+        if isinstance(url, unicode):
+            url = url.encode('utf-8')
+        keys.append(hashlib.md5(prefix + url).digest())
+    return keys
+
+
+def _encode_result(result):
+    """Encode an :func:`serpextract.extract` result (or ``None``) with
+    ``marshal``, referring to its parser by engine id."""
+    if result is None:
+        return marshal.dumps(None)
+    ref = serpextract._parser_ref(result.parser)
+    return marshal.dumps((result.engine_name, result.keyword, ref))
+
+
+def _fill(results, indexes, result):
+    """Set ``results[i]`` to ``result`` for the first of ``indexes`` and a
+    copy of it for the rest, since results are mutable."""
+    results[indexes[0]] = result
+    if result is not None:
+        for i in indexes[1:]:
+            results[i] = serpextract.ExtractResult(result.engine_name,
+                                                   result.keyword,
+                                                   result.parser)
+
+
+def _decode_result(value, parsers):
+    """
+    Decode a result encoded by :func:`_encode_result`.
+
+    :param parsers: Parsers already resolved from their references, which
+                    is updated with any new ones.
+    :type parsers:  ``dict``
+    """
+    value = marshal.loads(value)
+    if value is None:
+        return None
+    engine_name, keyword, ref = value
+    parser = parsers.get(ref)
+    if parser is None and ref is not None:
+        parser = parsers[ref] = serpextract._parser_from_ref(ref)
+    return serpextract.ExtractResult(engine_name, keyword, parser)
+
+
+class ResultCache(object):
+    """A cache of :func:`serpextract.extract` results in an SQLite database.
+
+    A cache holds results for any combination of normalization flags, and is
+    safe to share between processes (SQLite serializes writers) but not
+    between threads.
+    """
+
+    def __init__(self, filename, max_entries=1000000):
+        """
+        :param filename:    Path of the SQLite database, created if it doesn't
+                            exist, or ``':memory:'``.
+        :type filename:     ``str``
+
+        :param max_entries: Number of results to keep, ``None`` for no limit.
+        :type max_entries:  ``int`` or ``None``
+        """
+        self.filename = filename
+        self.max_entries = max_entries
+        self._db = sqlite3.connect(filename)
+        self._db.text_factory = str
+        self._parsers = {}
+        self._stats = {'hits': 0, 'misses': 0, 'invalidated': 0,
+                       'compacted': 0}
+
+        with self._db:
+            if filename != ':memory:':
+                self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute('PRAGMA synchronous=NORMAL')
+            self._db.execute('CREATE TABLE IF NOT EXISTS meta '
+                             '(name TEXT PRIMARY KEY, value TEXT)')
+            self._db.execute('CREATE TABLE IF NOT EXISTS results '
+                             '(key BLOB PRIMARY KEY, value BLOB, '
+                             'used INTEGER)')
+            self._db.execute('CREATE INDEX IF NOT EXISTS results_used '
+                             'ON results (used)')
+        self._version = None
+        self._check_version()
+        self._entries = self._count()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        self._db.close()
+
+    def __len__(self):
+        return self._entries
+
+    def _count(self):
+        return self._db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def _check_version(self):
+        """
+        Drop every entry if the search engine definitions have changed since
+        they were written.  Entries for other versions can never be hit since
+        the version is part of the key, this just reclaims the space.
+        """
+        version = serpextract._get_engines_version()
+        if version == self._version:
+            return
+
+        with self._db:
+            row = self._db.execute('SELECT value FROM meta '
+                                   "WHERE name = 'version'").fetchone()
+            if row is None or row[0] != version:
+                if row is not None:
+                    log.info(u'Search engines changed, clearing {}'.format(
+                        self.filename))
+                    self._stats['invalidated'] += self._count()
+                self._db.execute('DELETE FROM results')
+                self._db.execute('INSERT OR REPLACE INTO meta (name, value) '
+                                 "VALUES ('version', ?)", (version,))
+        self._version = version
+        self._entries = self._count()
+
+    def extract(self, serp_url, **kwargs):
+        """
+        :func:`serpextract.extract` through the cache.  Takes the same
+        keyword arguments except for ``parser``.
+        """
+        return self.extract_batch([serp_url], **kwargs)[0]
+
+    def extract_batch(self, serp_urls, **kwargs):
+        """
+        :func:`serpextract.extract_batch` through the cache.  Takes the same
+        keyword arguments except for ``parser``.
+
+        :returns: a ``list`` of :class:`serpextract.ExtractResult` instances
+                  (or ``None``) in input order.
+        """
+        if 'parser' in kwargs:
+            raise TypeError('ResultCache does not support a fixed parser')
+        serp_urls = list(serp_urls)
+        self._check_version()
+
+        keys = _url_keys(_key_prefix(self._version, kwargs), serp_urls)
+
+        now = int(time.time())
+        stale = now - _used_resolution
+        found = {}
+        touched = []
+        for chunk in _chunks(list(set(keys)), _chunk_size):
+            query = ('SELECT key, value, used FROM results WHERE key IN '
+                     '({})'.format(','.join('?' * len(chunk))))
+            for key, value, used in self._db.execute(query,
+                                                      map(buffer, chunk)):
+                key = str(key)
+                found[key] = value
+                if used < stale:
+                    touched.append((now, buffer(key)))
+
+        misses = {}
+        for i, key in enumerate(keys):
+            if key not in found and key not in misses:
+                misses[key] = i
+        self._stats['hits'] += len(keys) - len(misses)
+        self._stats['misses'] += len(misses)
+
+        if misses:
+            indexes = sorted(misses.itervalues())
+            results = serpextract.extract_batch([serp_urls[i]
+                                                 for i in indexes], **kwargs)
+            fresh = dict(zip(indexes, results))
+            rows = []
+            for i in indexes:
+                value = found[keys[i]] = buffer(_encode_result(fresh[i]))
+                rows.append((buffer(keys[i]), value, now))
+        else:
+            fresh = {}
+            rows = []
+
+        if rows or touched:
+            with self._db:
+                self._db.executemany('INSERT OR REPLACE INTO results '
+                                     '(key, value, used) VALUES (?, ?, ?)',
+                                     rows)
+                self._db.executemany('UPDATE results SET used = ? '
+                                     'WHERE key = ?', touched)
+            self._entries += len(rows)
+            if self.max_entries is not None and \
+                    self._entries > self.max_entries:
+                self.compact()
+
+        # Results are mutable so equal referrers each get their own
+        return [fresh[i] if i in fresh
+                else _decode_result(str(found[key]), self._parsers)
+                for i, key in enumerate(keys)]
+
+    def compact(self, max_entries=None, vacuum=False):
+        """
+        Drop the least recently used entries until at most 90% of
+        ``max_entries`` are left, so that a cache that's full isn't compacted
+        on every write.
+
+        :param max_entries: Defaults to the cache's ``max_entries``.
+        :type max_entries:  ``int`` or ``None``
+
+        :param vacuum:      Also give the freed space back to the file system.
+        :type vacuum:       ``True`` or ``False``
+
+        :returns: the number of entries dropped.
+        """
+        if max_entries is None:
+            max_entries = self.max_entries
+        self._entries = self._count()
+        dropped = 0
+        if max_entries is not None and self._entries > max_entries:
+            dropped = self._entries - int(max_entries * 0.9)
+            with self._db:
+                self._db.execute('DELETE FROM results WHERE key IN '
+                                 '(SELECT key FROM results ORDER BY used '
+                                 'LIMIT ?)', (dropped,))
+            self._entries -= dropped
+            self._stats['compacted'] += dropped
+        if vacuum:
+            self._db.execute('VACUUM')
+        return dropped
+
+    def clear(self):
+        """Drop every entry."""
+        with self._db:
+            self._db.execute('DELETE FROM results')
+        self._entries = 0
+
+    def get_stats(self):
+        """
+        Return the number of ``hits`` and ``misses`` since the cache was
+        opened, the number of entries ``invalidated`` by a change to the
+        search engine definitions or ``compacted`` away, and the current
+        number of ``entries``.
+
+        :returns: a ``dict``.
+        """
+        stats = dict(self._stats)
+        stats['entries'] = self._entries
+        return stats
+
+
+# Layout of a SharedResultCache file: a header, a table of per-worker
+# statistics and then the slots, each of which starts with a sequence number,
+# the length of its value, a referenced flag and its key
+_shared_magic = 'SERPSHM2'
+_shared_header = struct.Struct('<8sIIII32s')
+_shared_worker = struct.Struct('<IQQQ')
+_shared_slot = struct.Struct('<IHBx16s')
+_shared_seq = struct.Struct('<I')
+_shared_ref_offset = 6
+_shared_hash = struct.Struct('<Q')
+
+# Number of slots a key may be stored in
+_shared_ways = 4
+
+
+class SharedResultCache(object):
+    """A fixed-size cache of :func:`serpextract.extract` results in a
+    memory-mapped file that can be shared by every process on a host.
+
+    The file (put it on a tmpfs such as ``/dev/shm``) holds a hash table of
+    fixed-size slots in which each key can live in one of four slots.  A full
+    set of slots evicts one that hasn't been read since the set was last
+    written to (the CLOCK algorithm), so memory use never grows.  Writers
+    lock the stripe of the table they write to with ``fcntl`` while readers
+    take no locks at all: every slot has a sequence number which is odd
+    while it's being written, and a read which sees it change is treated as
+    a miss.  Results too large for a slot aren't cached.
+
+    Processes may open the same file or inherit an open cache over
+    ``fork``.  A cache isn't safe to share between threads.
+    """
+
+    def __init__(self, filename, slots=65536, slot_size=256, max_workers=64,
+                 stripes=64):
+        """
+        :param filename:    Path of the cache file, created if it doesn't
+                            exist.  The size options are ignored if it does.
+        :type filename:     ``str``
+
+        :param slots:       Number of results to hold.
+        :type slots:        ``int``
+
+        :param slot_size:   Bytes per result, including a 24 byte header.
+        :type slot_size:    ``int``
+
+        :param max_workers: Number of processes to keep statistics for, see
+                            :meth:`get_worker_stats`.
+        :type max_workers:  ``int``
+
+        :param stripes:     Number of locks to split writes between.
+        :type stripes:      ``int``
+        """
+        self.filename = filename
+        self._fd = os.open(filename, os.O_RDWR | os.O_CREAT, 0644)
+        self._map = None
+        self._parsers = {}
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'uncacheable': 0,
+                       'invalidated': 0}
+        version = serpextract._get_engines_version()
+
+        with self._locked(0):
+            header = self._read_header()
+            if header is None:
+                slots -= slots % _shared_ways
+                header = (_shared_magic, slots, slot_size, max_workers,
+                          stripes, version)
+                self._set_geometry(*header[1:5])
+                os.ftruncate(self._fd, 0)
+                os.ftruncate(self._fd, self._size)
+            self._map = mmap.mmap(self._fd, self._size)
+            if header[5] != version:
+                log.info(u'Search engines changed, clearing {}'.format(
+                    filename))
+                self._stats['invalidated'] = 1
+                self._zero_slots()
+            _shared_header.pack_into(self._map, 0, *header[:5] + (version,))
+
+        self._claim_worker()
+
+    def _set_geometry(self, slots, slot_size, max_workers, stripes):
+        self.slots = slots
+        self.slot_size = slot_size
+        self.max_workers = max_workers
+        self.stripes = stripes
+        self._buckets = slots // _shared_ways
+        self._workers_offset = _shared_header.size
+        offset = self._workers_offset + max_workers * _shared_worker.size
+        self._slots_offset = (offset + 63) // 64 * 64
+        self._size = self._slots_offset + slots * slot_size
+
+    def _read_header(self):
+        """Return the header of an existing cache file with a valid layout
+        (and set up this cache to match it), or ``None``."""
+        size = os.fstat(self._fd).st_size
+        if size < _shared_header.size:
+            return None
+        os.lseek(self._fd, 0, os.SEEK_SET)
+        header = _shared_header.unpack(os.read(self._fd, _shared_header.size))
+        if header[0] != _shared_magic:
+            return None
+        self._set_geometry(*header[1:5])
+        if self._size != size or self._buckets == 0 or \
+                self.slot_size <= _shared_slot.size:
+            return None
+        return header
+
+    @contextmanager
+    def _locked(self, offset):
+        """Hold an exclusive lock on byte ``offset`` of the cache file.
+        Byte 0 guards the header and worker table, byte ``1 + n`` stripe
+        ``n`` of the slots."""
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, 1, offset)
+        try:
+            yield
+        finally:
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, offset)
+
+    def _zero_slots(self):
+        chunk = '\0' * (1 << 20)
+        for start in xrange(self._slots_offset, self._size, len(chunk)):
+            end = min(start + len(chunk), self._size)
+            self._map[start:end] = chunk[:end - start]
+
+    def _claim_worker(self):
+        """Claim a row of the worker table for this process: the row it
+        already has, an unused row or one whose process has exited."""
+        self._pid = os.getpid()
+        self._worker_offset = None
+        with self._locked(0):
+            rows = [self._workers_offset + i * _shared_worker.size
+                    for i in xrange(self.max_workers)]
+            pids = [_shared_worker.unpack_from(self._map, row)[0]
+                    for row in rows]
+            candidates = [row for row, pid in zip(rows, pids)
+                          if pid == self._pid]
+            candidates += [row for row, pid in zip(rows, pids) if pid == 0]
+            for row, pid in zip(rows, pids):
+                if pid and pid != self._pid:
+                    try:
+                        os.kill(pid, 0)
+                    except OSError:
+                        candidates.append(row)
+            if candidates:
+                self._worker_offset = candidates[0]
+                self._publish()
+
+    def _publish(self):
+        if self._worker_offset is not None:
+            _shared_worker.pack_into(self._map, self._worker_offset,
+                                     self._pid, self._stats['hits'],
+                                     self._stats['misses'],
+                                     self._stats['stores'])
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._publish()
+            self._map.close()
+            self._map = None
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
+
+    def _bucket(self, key):
+        return _shared_hash.unpack_from(key)[0] % self._buckets
+
+    def _get(self, key):
+        """Return the encoded result stored for ``key``, or ``None``."""
+        m = self._map
+        offset = self._slots_offset + \
+            self._bucket(key) * _shared_ways * self.slot_size
+        for _ in xrange(_shared_ways):
+            seq, length, referenced, slot_key = \
+                _shared_slot.unpack_from(m, offset)
+            if slot_key == key and length and not seq & 1:
+                start = offset + _shared_slot.size
+                value = m[start:start + length]
+                if _shared_seq.unpack_from(m, offset)[0] != seq:
+                    return None  # Being written
+                if not referenced:
+                    # Only a hint for eviction so it needs no lock
+                    m[offset + _shared_ref_offset] = '\x01'
+                return value
+            offset += self.slot_size
+        return None
+
+    def _put_many(self, items):
+        """Store ``(key, encoded result)`` pairs, taking each stripe's lock
+        once."""
+        m = self._map
+        max_length = self.slot_size - _shared_slot.size
+        by_stripe = {}
+        for key, value in items:
+            if len(value) > max_length:
+                self._stats['uncacheable'] += 1
+                continue
+            bucket = self._bucket(key)
+            by_stripe.setdefault(bucket % self.stripes, []).append(
+                (bucket, key, value))
+
+        for stripe, stripe_items in by_stripe.iteritems():
+            with self._locked(1 + stripe):
+                for bucket, key, value in stripe_items:
+                    base = self._slots_offset + \
+                        bucket * _shared_ways * self.slot_size
+                    target = self._find_slot(base, key)
+                    seq = _shared_seq.unpack_from(m, target)[0] | 1
+                    _shared_seq.pack_into(m, target, seq)
+                    start = target + _shared_slot.size
+                    m[start:start + len(value)] = value
+                    _shared_slot.pack_into(m, target, seq, len(value), 0, key)
+                    _shared_seq.pack_into(m, target, (seq + 1) & 0xffffffff)
+                    self._stats['stores'] += 1
+
+    def _find_slot(self, base, key):
+        """
+        Return the offset of the slot to store ``key`` in, out of the set of
+        slots starting at ``base``: the one that already holds it, an empty
+        one, or the first one that hasn't been referenced, clearing the
+        referenced flags passed over.  Callers must hold the set's stripe
+        lock.
+        """
+        m = self._map
+        offsets = [base + way * self.slot_size
+                   for way in xrange(_shared_ways)]
+        slots = [_shared_slot.unpack_from(m, offset) for offset in offsets]
+        for offset, (_, _, _, slot_key) in zip(offsets, slots):
+            if slot_key == key:
+                return offset
+        for offset, (_, length, _, _) in zip(offsets, slots):
+            if not length:
+                return offset
+        for offset, (_, _, referenced, _) in zip(offsets, slots):
+            if not referenced:
+                return offset
+            m[offset + _shared_ref_offset] = '\x00'
+        # Every slot was referenced, evict one picked by the key
+        return offsets[ord(key[-1]) % _shared_ways]
+
+    def extract(self, serp_url, **kwargs):
+        """
+        :func:`serpextract.extract` through the cache.  Takes the same
+        keyword arguments except for ``parser``.
+        """
+        return self.extract_batch([serp_url], **kwargs)[0]
+
+    def extract_batch(self, serp_urls, **kwargs):
+        """
+        :func:`serpextract.extract_batch` through the cache.  Takes the same
+        keyword arguments except for ``parser``.
+
+        :returns: a ``list`` of :class:`serpextract.ExtractResult` instances
+                  (or ``None``) in input order.
+        """
+        if 'parser' in kwargs:
+            raise TypeError('SharedResultCache does not support a fixed '
+                            'parser')
+        serp_urls = list(serp_urls)
+        if os.getpid() != self._pid:
+            # Inherited over fork, statistics are per process
+            self._stats = dict.fromkeys(self._stats, 0)
+            self._claim_worker()
+
+        # Look up, extract and decode each distinct referrer once
+        indexes_by_url = {}
+        for i, url in enumerate(serp_urls):
+            indexes_by_url.setdefault(url, []).append(i)
+        urls = indexes_by_url.keys()
+        prefix = _key_prefix(serpextract._get_engines_version(), kwargs)
+        keys = _url_keys(prefix, urls)
+
+        results = [None] * len(serp_urls)
+        misses = []
+        for url, key in zip(urls, keys):
+            value = self._get(key)
+            if value is not None:
+                try:
+                    result = _decode_result(value, self._parsers)
+                except (ValueError, EOFError, TypeError):
+                    log.debug(u'Corrupt shared cache entry', exc_info=True)
+                else:
+                    _fill(results, indexes_by_url[url], result)
+                    continue
+            misses.append((url, key))
+
+        missed = sum(len(indexes_by_url[url]) for url, _ in misses)
+        self._stats['hits'] += len(serp_urls) - missed
+        self._stats['misses'] += missed
+        if misses:
+            fresh = serpextract.extract_batch([url for url, _ in misses],
+                                              **kwargs)
+            items = []
+            for (url, key), result in zip(misses, fresh):
+                _fill(results, indexes_by_url[url], result)
+                items.append((key, _encode_result(result)))
+            self._put_many(items)
+        self._publish()
+        return results
+
+    def clear(self):
+        """Drop every entry."""
+        with self._locked(0):
+            self._zero_slots()
+
+    def get_stats(self):
+        """
+        Return this process's number of ``hits``, ``misses`` and ``stores``,
+        the number of results that were ``uncacheable`` because they didn't
+        fit in a slot and whether the cache was ``invalidated`` by a change
+        to the search engine definitions when it was opened.
+
+        :returns: a ``dict``.
+        """
+        return dict(self._stats)
+
+    def get_worker_stats(self):
+        """
+        Return the ``hits``, ``misses`` and ``stores`` of every process that
+        has used the cache (see ``max_workers``), including ones that have
+        exited since.
+
+        :returns: a ``list`` of ``dict`` with keys ``pid``, ``hits``,
+                  ``misses`` and ``stores``.
+        """
+        stats = []
+        for i in xrange(self.max_workers):
+            row = self._workers_offset + i * _shared_worker.size
+            pid, hits, misses, stores = \
+                _shared_worker.unpack_from(self._map, row)
+            if pid:
+                stats.append({'pid': pid, 'hits': hits, 'misses': misses,
+                              'stores': stores})
+        return stats
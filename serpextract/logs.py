@@ -0,0 +1,562 @@
+"""Streaming adapters which pull the referrer out of web server and CDN log
+lines without parsing the whole line, and feed them to
+:func:`serpextract.extract_batch`.
+
+Each adapter takes an iterable of lines and yields one referrer per line
+(``None`` when a line has no referrer) so that results can be matched back
+up with the lines they came from::
+
+    from serpextract.logs import combined_referrers, extract_referrers
+
+    with open('access.log', 'rb') as log:
+        for referrer, result in extract_referrers(combined_referrers(log)):
+            if result is not None:
+                print result.engine_name, result.keyword
+
+:class:`LogFollower` and :func:`follow_referrers` do the same for logs that
+are still being written to, see ``serpextract --follow``.
+"""
+import os
+import csv
+import time
+import logging
+import tempfile
+from itertools import islice
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from .serpextract import extract_batch
+
+
+__all__ = ('combined_referrers', 'delimited_referrers', 'csv_referrers',
+           'jsonl_referrers', 'extract_referrers', 'get_adapter', 'FORMATS',
+           'LogFollower', 'follow_referrers')
+
+log = logging.getLogger('serpextract')
+
+
+def _find_closing_quote(line, start):
+    """
+    Find the index of the first ``"`` at or after ``start`` which isn't
+    escaped with a backslash, or ``-1``.
+    """
+    end = line.find('"', start)
+    while end > 0 and line[end - 1] == '\\':
+        # Count the backslashes, an even number escape each other
+        slashes = 1
+        while end - slashes - 1 >= start and line[end - slashes - 1] == '\\':
+            slashes += 1
+        if slashes % 2 == 0:
+            break
+        end = line.find('"', end + 1)
+    return end
+
+
+def _unescape(value):
+    """Undo Apache's and nginx's escaping of quotes and backslashes."""
+    if '\\' not in value:
+        return value
+    return value.replace('\\"', '"').replace('\\x22', '"') \
+                .replace('\\\\', '\\')
+
+
+def _combined_referrer(line):
+    # host ident user [date] "request" status size "referrer" "user-agent"
+    start = line.find('] "')
+    if start < 0:
+        return None
+    start = _find_closing_quote(line, start + 3)  # End of request
+    if start < 0:
+        return None
+    start = line.find(' "', start + 1)  # Skip status and size
+    if start < 0:
+        return None
+    start += 2
+    end = _find_closing_quote(line, start)
+    if end < 0:
+        return None
+
+    referrer = line[start:end]
+    if referrer == '-' or referrer == '':
+        return None
+    return _unescape(referrer)
+
+
+def combined_referrers(lines):
+    """
+    Yield the referrer from each line of an Apache/nginx combined format log
+    (any fields after the user agent are ignored).  Only the quoted request
+    field is skipped over, the rest of the line is never split.
+
+    :param lines: Log lines.
+    :type lines:  iterable of ``str``
+    """
+    for line in lines:
+        yield _combined_referrer(line)
+
+
+def _column_index(names, column):
+    """Return the index of ``column`` in the header ``names``."""
+    try:
+        return names.index(column)
+    except ValueError:
+        raise ValueError('No {!r} column in the header, the columns are '
+                         '{}'.format(column, ', '.join(names)))
+
+
+def delimited_referrers(lines, column, delimiter='\t', header=False):
+    """
+    Yield the referrer from each line of a delimited log without quoting
+    (e.g. TSV CDN logs) by slicing out a single column.  A header is read
+    straight away, so a missing ``column`` raises ``ValueError`` here rather
+    than on the first referrer.
+
+    :param lines:     Log lines.
+    :type lines:      iterable of ``str``
+
+    :param column:    Index of the referrer column, or its name if
+                      ``header`` is ``True``.
+    :type column:     ``int`` or ``str``
+
+    :param delimiter: Column delimiter.
+    :type delimiter:  ``str``
+
+    :param header:    Whether the first line is a header naming the columns.
+    :type header:     ``True`` or ``False``
+    """
+    lines = iter(lines)
+    if header:
+        names = next(lines, '').rstrip('\r\n').split(delimiter)
+        column = _column_index(names, column)
+    return _delimited_referrers(lines, column, delimiter)
+
+
+def _delimited_referrers(lines, column, delimiter):
+    for line in lines:
+        fields = line.rstrip('\r\n').split(delimiter, column + 1)
+        if len(fields) <= column:
+            yield None
+            continue
+        referrer = fields[column]
+        yield referrer if referrer not in ('', '-') else None
+
+
+def csv_referrers(lines, column, header=False, **fmtparams):
+    """
+    Yield the referrer from each row of a CSV log, see
+    :func:`delimited_referrers`.  Any extra keyword arguments are passed to
+    ``csv.reader``.
+    """
+    rows = csv.reader(lines, **fmtparams)
+    if header:
+        column = _column_index(next(rows, []), column)
+    return _csv_referrers(rows, column)
+
+
+def _csv_referrers(rows, column):
+    for row in rows:
+        if len(row) <= column:
+            yield None
+            continue
+        referrer = row[column]
+        yield referrer if referrer not in ('', '-') else None
+
+
+def _skip_whitespace(line, start):
+    while line[start:start + 1] in (' ', '\t'):
+        start += 1
+    return start
+
+
+def _jsonl_referrer(line, key, needle):
+    start = line.find(needle)
+    if start >= 0:
+        start = _skip_whitespace(line, start + len(needle))
+        if line[start:start + 1] == ':':
+            start = _skip_whitespace(line, start + 1)
+        else:
+            start = -1  # Not a key after all
+    if start >= 0:
+        if line[start:start + 1] == '"':
+            end = line.find('"', start + 1)
+            referrer = line[start + 1:end]
+            if end > 0 and '\\' not in referrer:
+                return referrer or None
+        elif line[start:start + 4] == 'null':
+            return None
+
+    # Escaped or otherwise unusual value, or the key wasn't found as we
+    # expected it, so give in and parse the whole line
+    try:
+        referrer = json.loads(line).get(key)
+    except (ValueError, AttributeError):
+        log.debug(u'Malformed JSON line {!r}'.format(line), exc_info=True)
+        return None
+    if isinstance(referrer, unicode):
+        referrer = referrer.encode('utf-8')
+    return referrer or None
+
+
+def jsonl_referrers(lines, key='referrer'):
+    """
+    Yield the referrer from each line of a JSON Lines log.  Values without
+    escape sequences are sliced straight out of the line, anything else falls
+    back to ``json.loads``.  ``key`` is assumed to only appear once per line.
+
+    :param lines: Log lines.
+    :type lines:  iterable of ``str``
+
+    :param key:   Name of the referrer key.
+    :type key:    ``str``
+    """
+    needle = '"{}"'.format(key)
+    for line in lines:
+        yield _jsonl_referrer(line, key, needle)
+
+
+def extract_referrers(referrers, batch_size=1000, cache=None, **kwargs):
+    """
+    Extract keywords from a stream of referrers in batches, see
+    :func:`serpextract.extract_batch` for keyword arguments.
+
+    :param referrers:  Referrers, ``None`` for lines without one.
+    :type referrers:   iterable of ``str``
+
+    :param batch_size: Number of referrers to extract at a time.
+    :type batch_size:  ``int``
+
+    :param cache:      Optionally extract through a persistent cache.
+    :type cache:       :class:`serpextract.cache.ResultCache`
+
+    :returns: a generator of ``(referrer, result)`` tuples in input order,
+              ``result`` is ``None`` for referrers that aren't SERPs.
+    """
+    extract = cache.extract_batch if cache is not None else extract_batch
+    referrers = iter(referrers)
+    while True:
+        batch = list(islice(referrers, batch_size))
+        if not batch:
+            return
+
+        urls = [referrer for referrer in batch if referrer is not None]
+        results = iter(extract(urls, **kwargs))
+        for referrer in batch:
+            if referrer is None:
+                yield referrer, None
+            else:
+                yield referrer, next(results)
+
+
+# Input formats supported by the serpextract console script
+FORMATS = ('combined', 'tsv', 'csv', 'jsonl')
+
+
+def get_adapter(fmt, field=None):
+    """
+    Return an adapter for one of ``FORMATS`` that takes an iterable of lines
+    and yields referrers.
+
+    :param fmt:   One of ``FORMATS``.
+    :type fmt:    ``str``
+
+    :param field: Referrer column index (or name when it isn't a number, in
+                  which case the first line must be a header) for ``tsv`` and
+                  ``csv``, or key for ``jsonl``.
+    :type field:  ``str`` or ``None``
+    """
+    if fmt == 'combined':
+        return combined_referrers
+    if fmt == 'jsonl':
+        return lambda lines: jsonl_referrers(lines, field or 'referrer')
+    if fmt in ('tsv', 'csv'):
+        if field is None:
+            raise ValueError('A referrer column is required for '
+                             '{}'.format(fmt))
+        header = not field.isdigit()
+        column = field if header else int(field)
+        if fmt == 'tsv':
+            return lambda lines: delimited_referrers(lines, column,
+                                                     header=header)
+        return lambda lines: csv_referrers(lines, column, header=header)
+    raise ValueError('Unknown log format {!r}'.format(fmt))
+
+
+class _TailedFile(object):
+    """A log file followed by :class:`LogFollower`."""
+    __slots__ = ('filename', 'f', 'inode', 'offset', 'pending_since')
+
+    def __init__(self, filename, inode=None, offset=None):
+        self.filename = filename
+        self.f = None
+        self.inode = inode
+        # None until the file is first opened means start at its end
+        self.offset = offset
+        self.pending_since = None
+
+    def _open(self):
+        try:
+            f = open(self.filename, 'rb')
+        except IOError:
+            return False  # Not created yet, or between rotations
+        stat = os.fstat(f.fileno())
+        if self.offset is None:
+            self.offset = stat.st_size
+        elif stat.st_ino != self.inode or stat.st_size < self.offset:
+            # Rotated or truncated since the checkpoint was saved
+            self.offset = 0
+        self.f = f
+        self.inode = stat.st_ino
+        return True
+
+    def _read(self, max_bytes, final=False):
+        self.f.seek(self.offset)
+        lines = []
+        size = 0
+        for line in self.f:
+            if line[-1:] != '\n' and not final:
+                break  # Still being written
+            lines.append(line)
+            size += len(line)
+            if size >= max_bytes:
+                break
+        self.offset += size
+        return lines, size
+
+    def _rotated(self):
+        """Whether a new, non-empty file has replaced the one we have open
+        (the server only writes to the new one once it has reopened it)."""
+        try:
+            stat = os.stat(self.filename)
+        except OSError:
+            return False
+        return stat.st_ino != self.inode and stat.st_size > 0
+
+    def read(self, max_bytes, now):
+        """
+        Read complete lines from where we left off.
+
+        :returns: a ``(lines, size)`` tuple.
+        """
+        if self.f is None and not self._open():
+            return [], 0
+
+        if os.fstat(self.f.fileno()).st_size < self.offset:
+            self.offset = 0  # Truncated in place, e.g. copytruncate
+        lines, size = self._read(max_bytes)
+        if size < max_bytes and self._rotated():
+            # Caught up with the old file so finish it, including a last
+            # line without a newline, and move on to the new one
+            rest, rest_size = self._read(max_bytes, final=True)
+            lines += rest
+            size += rest_size
+            self.close()
+            self.offset = 0
+            self._open()
+
+        if self.unread_bytes():
+            if self.pending_since is None:
+                self.pending_since = now
+        else:
+            self.pending_since = None
+        return lines, size
+
+    def unread_bytes(self):
+        if self.f is None:
+            return 0
+        return max(os.fstat(self.f.fileno()).st_size - self.offset, 0)
+
+    def close(self):
+        if self.f is not None:
+            self.f.close()
+            self.f = None
+
+
+class LogFollower(object):
+    """Follows log files as they are written to, like ``tail -F``.
+
+    Files are followed across rotation (renamed and replaced, or truncated in
+    place, which is noticed if the file is shorter than what has been read when
+    it is next read) and only complete lines are read.  How far each file has
+    been read is saved to an optional checkpoint file by :meth:`commit`, so a
+    restarted follower carries on where the last one left off::
+
+        follower = LogFollower(['access.log'], checkpoint='access.offsets')
+        while True:
+            for line in follower.read():
+                ...
+            follower.commit()
+    """
+
+    _checkpoint_format = 1
+
+    def __init__(self, filenames, checkpoint=None, from_start=False,
+                 max_bytes=1 << 20):
+        """New instance of a :class:`LogFollower`.
+
+        :param filenames:  Log files to follow.
+        :type filenames:   ``list`` of ``str``
+
+        :param checkpoint: Where to save offsets, files in the checkpoint
+                           carry on from its offsets.
+        :type checkpoint:  ``str``
+
+        :param from_start: Read files that aren't in the checkpoint from the
+                           start rather than only new lines.
+        :type from_start:  ``True`` or ``False``
+
+        :param max_bytes:  Bytes to read from each file per :meth:`read`.
+        :type max_bytes:   ``int``
+        """
+        self.checkpoint = checkpoint
+        self.max_bytes = max_bytes
+        saved = self._load_checkpoint()
+        self.files = []
+        for filename in filenames:
+            filename = os.path.abspath(filename)
+            inode, offset = saved.get(filename, (None, 0 if from_start
+                                                 else None))
+            self.files.append(_TailedFile(filename, inode, offset))
+        for tailed in self.files:
+            if not tailed._open() and tailed.offset is None:
+                tailed.offset = 0  # Read files created later from the start
+
+    def _load_checkpoint(self):
+        if self.checkpoint is None or not os.path.exists(self.checkpoint):
+            return {}
+        with open(self.checkpoint, 'rb') as f:
+            data = json.load(f)
+        if data.get('format') != self._checkpoint_format:
+            raise ValueError('Unsupported checkpoint format {!r}'.format(
+                data.get('format')))
+        return dict((filename, (state['inode'], state['offset']))
+                    for filename, state in data['files'].iteritems())
+
+    def read(self):
+        """
+        Read the complete lines written to each file since the last call, up
+        to ``max_bytes`` per file.
+
+        :returns: a ``list`` of lines.
+        """
+        now = time.time()
+        lines = []
+        for tailed in self.files:
+            lines += tailed.read(self.max_bytes, now)[0]
+        return lines
+
+    def commit(self):
+        """
+        Atomically save how far each file has been read to the checkpoint
+        file.  Call this once the lines returned by :meth:`read` have been
+        processed.
+        """
+        if self.checkpoint is None:
+            return
+        files = dict((tailed.filename, {'inode': tailed.inode,
+                                        'offset': tailed.offset})
+                     for tailed in self.files if tailed.inode is not None)
+        dirname = os.path.dirname(os.path.abspath(self.checkpoint))
+        fd, tmpname = tempfile.mkstemp(dir=dirname, prefix='.checkpoint')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                json.dump({'format': self._checkpoint_format, 'files': files},
+                          f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.rename(tmpname, self.checkpoint)
+        except (IOError, OSError):
+            os.unlink(tmpname)
+            raise
+
+    def get_lag(self):
+        """
+        How far behind the ends of the files the follower is.
+
+        :returns: a ``(bytes, seconds)`` tuple of the bytes written but not
+                  yet read and the seconds since the oldest of them were
+                  first seen.
+        """
+        now = time.time()
+        unread = sum(tailed.unread_bytes() for tailed in self.files)
+        since = [tailed.pending_since for tailed in self.files
+                 if tailed.pending_since is not None]
+        return unread, now - min(since) if since else 0.0
+
+    def close(self):
+        for tailed in self.files:
+            tailed.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def follow_referrers(follower, adapter, interval=10.0, poll=1.0,
+                     batch_size=1000, cache=None, **kwargs):
+    """
+    Extract keywords from the lines a :class:`LogFollower` reads, in
+    batches, and yield the SERPs found in each ``interval`` along with
+    throughput and lag metrics.  Call :meth:`LogFollower.commit` once each
+    interval has been handled.  See :func:`extract_referrers` for the rest
+    of the arguments.
+
+    :param follower: Log files to follow.
+    :type follower:  :class:`LogFollower`
+
+    :param adapter:  Pulls referrers out of lines, see :func:`get_adapter`.
+    :type adapter:   ``function``
+
+    :param interval: Seconds per interval.
+    :type interval:  ``float``
+
+    :param poll:     Seconds to wait for new lines when there are none.
+    :type poll:      ``float``
+
+    :returns: a generator of ``(results, stats)`` tuples where ``results``
+              is a ``list`` of ``(referrer, result)`` tuples for each SERP
+              and ``stats`` a ``dict`` with the number of ``lines``,
+              ``bytes`` and ``serps`` read, the ``seconds`` the interval took
+              and how many of them were ``busy_seconds`` spent extracting,
+              ``lines_per_second`` of busy time and ``lag_bytes`` and
+              ``lag_seconds`` from :meth:`LogFollower.get_lag`.
+    """
+    while True:
+        start = time.time()
+        deadline = start + interval
+        results = []
+        lines_read = bytes_read = 0
+        busy_seconds = 0.0
+        while True:
+            busy_start = time.time()
+            lines = follower.read()
+            if lines:
+                lines_read += len(lines)
+                bytes_read += sum(len(line) for line in lines)
+                results.extend((referrer, result) for referrer, result in
+                               extract_referrers(adapter(lines), batch_size,
+                                                 cache, **kwargs)
+                               if result is not None)
+                busy_seconds += time.time() - busy_start
+            now = time.time()
+            if now >= deadline:
+                break
+            if not lines:
+                time.sleep(min(poll, deadline - now))
+
+        lag_bytes, lag_seconds = follower.get_lag()
+        yield results, {
+            'lines': lines_read,
+            'bytes': bytes_read,
+            'serps': len(results),
+            'seconds': now - start,
+            'busy_seconds': busy_seconds,
+            'lines_per_second': (lines_read / busy_seconds if busy_seconds
+                                 else 0.0),
+            'lag_bytes': lag_bytes,
+            'lag_seconds': lag_seconds,
+        }
@@ -0,0 +1,111 @@
+"""Extraction of long streams of referrers in a pool of worker threads or
+processes, so that the caller isn't blocked extracting one batch at a time::
+
+    from multiprocessing import Pool
+    from serpextract.pipeline import imap_extract
+
+    pool = Pool(4)
+    for referrer, result in imap_extract(referrers, pool):
+        ...
+
+Referrers are cut into chunks which are extracted with
+:func:`serpextract.extract_batch` in the pool.  Results come back in input
+order, and no more than ``max_in_flight`` chunks are read ahead of the
+caller, so a slow consumer holds back a fast producer rather than letting
+chunks pile up in memory.
+
+Thread pools may have any number of workers, the lookup caches they share
+are locked.  Process pools send results back packed with
+:func:`serpextract.dump_results`, which refers to parsers by their engine id.
+Custom parsers and engine profiles must therefore be set up before the pool
+is created, so that the workers have them too.
+"""
+from collections import deque
+from itertools import islice
+from multiprocessing.pool import ThreadPool
+
+from . import serpextract
+
+
+__all__ = ('imap_extract',)
+
+
+def _extract_chunk(urls, kwargs, packed):
+    """Run in a worker, see :func:`imap_extract`."""
+    results = serpextract.extract_batch(urls, **kwargs)
+    if packed:
+        return serpextract.dump_results(results)
+    return results
+
+
+def _chunk_pairs(chunk, async_result, packed):
+    """Wait for a chunk's results and match them back up with its
+    referrers."""
+    results = async_result.get()
+    if packed:
+        results = serpextract.load_results(results)
+    results = iter(results)
+    for referrer in chunk:
+        if referrer is None:
+            yield referrer, None
+        else:
+            yield referrer, next(results)
+
+
+def imap_extract(referrers, pool=None, chunk_size=1000, max_in_flight=None,
+                 **kwargs):
+    """
+    Extract keywords from a stream of referrers in ``pool``, see
+    :func:`serpextract.extract_batch` for keyword arguments.
+
+    :param referrers:     Referrers, ``None`` for lines without one.
+    :type referrers:      iterable of ``str``
+
+    :param pool:          Where to extract, defaults to a single worker
+                          thread which is shut down when the stream ends.
+    :type pool:           :class:`multiprocessing.pool.Pool` or
+                          :class:`multiprocessing.pool.ThreadPool`
+
+    :param chunk_size:    Number of referrers to extract at a time.
+    :type chunk_size:     ``int``
+
+    :param max_in_flight: Maximum number of chunks that have been read but
+                          not yielded yet, defaults to twice the number of
+                          workers in a ``multiprocessing`` pool, or 2 for
+                          other pools.
+    :type max_in_flight:  ``int``
+
+    :returns: a generator of ``(referrer, result)`` tuples in input order,
+              ``result`` is ``None`` for referrers that aren't SERPs.
+    """
+    own_pool = pool is None
+    if own_pool:
+        pool = ThreadPool(1)
+    packed = not isinstance(pool, ThreadPool)
+    if max_in_flight is None:
+        max_in_flight = 2 * getattr(pool, '_processes', 1)
+    if max_in_flight < 1:
+        raise ValueError('max_in_flight must be at least 1')
+
+    referrers = iter(referrers)
+    pending = deque()
+    try:
+        while True:
+            chunk = list(islice(referrers, chunk_size))
+            if chunk:
+                urls = [referrer for referrer in chunk if referrer is not None]
+                pending.append((chunk, pool.apply_async(
+                    _extract_chunk, (urls, kwargs, packed))))
+            # Yield finished chunks in order without waiting for the rest,
+            # and only wait when there are too many chunks in flight or
+            # nothing left to read
+            while pending and (not chunk or len(pending) >= max_in_flight or
+                               pending[0][1].ready()):
+                chunk_done, async_result = pending.popleft()
+                for pair in _chunk_pairs(chunk_done, async_result, packed):
+                    yield pair
+            if not chunk:
+                return
+    finally:
+        if own_pool:
+            pool.terminate()
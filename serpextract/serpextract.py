@@ -1,9 +1,15 @@
 """Utilities for extracting keyword information from search engine
 referrers."""
 import re
+import json
+import hashlib
 import logging
-from itertools import groupby
-from urlparse import urlparse, parse_qs, ParseResult
+import marshal
+import threading
+from array import array
+from itertools import groupby, izip
+from urllib import quote, quote_plus
+from urlparse import urlparse, parse_qs, unquote, ParseResult
 
 from iso3166 import countries
 import pylru
@@ -33,8 +39,13 @@ except ImportError:
     import pickle
 
 
-__all__ = ('get_parser', 'is_serp', 'extract', 'get_all_query_params',
-           'add_custom_parser', 'SearchEngineParser')
+__all__ = ('get_parser', 'is_serp', 'is_serp_batch', 'extract',
+           'extract_batch', 'get_all_query_params', 'add_custom_parser',
+           'get_lookup_stats', 'set_limits', 'get_limits',
+           'get_rejection_stats', 'dump_results', 'load_results',
+           'get_serp_urls',
+           'get_rule_stats', 'save_engine_profile', 'load_engine_profile',
+           'unload_engine_profile', 'BatchPlan', 'SearchEngineParser')
 
 log = logging.getLogger('serpextract')
 
@@ -45,9 +56,54 @@ _country_codes = [country.alpha2.lower()
 # http://en.wikipedia.org/wiki/ISO_3166-1 for more information
 _country_codes += ['uk']
 
+# pylru caches aren't thread-safe, even to read from, so every use of
+# _domain_cache, _plan_cache and _fallback_cache holds this lock
+_cache_lock = threading.Lock()
+
 # A LRUCache of domains to save us from having to do lots of regex matches
 _domain_cache = pylru.lrucache(500)
 
+# A LRUCache of per-host lookup plans used by get_parser, see _LookupPlan.
+# Referrers have a long tail of hosts, and a plan that's evicted before its
+# host comes back costs more than the lookup it saves, so this holds enough
+# of them (about 0.5 KB each) to ride out the tail.
+_plan_cache = pylru.lrucache(10000)
+
+# Hosts (the part of a match rule before the first '/') of all the match
+# rules that include a path, see _get_path_rule_hosts
+_path_rule_hosts = None
+
+# Index of the host suffix, path prefix and query prefix match rules, see
+# _WildcardIndex
+_wildcard_index = None
+
+# Number of get_parser lookups resolved by each tier of match rules, and by
+# each match rule
+_lookup_stats = {}
+_rule_stats = {}
+
+# Limits applied to referrers before they are parsed, see set_limits
+_limits = {
+    'max_url_length': None,
+    'max_query_params': None,
+    'max_keyword_length': None,
+    'validate_host': False,
+}
+_limits_enabled = False
+
+# Number of referrers rejected (or truncated) by each limit
+_rejection_stats = {}
+
+# Characters that never appear in a valid netloc
+_invalid_host_re = re.compile(r'[\s"<>\\^`{|}\x00-\x1f\x7f]', re.UNICODE)
+_max_host_length = 300
+
+_query_separator_re = re.compile(r'[&;]')
+
+# Compiled regular expression keyword extractors shared by all parsers, see
+# SearchEngineParser
+_extractor_regexes = {}
+
 # Naive search engine detection.  Look for \.?search\. in the netloc and then
 # try to extract using common query params
 _naive_re = re.compile(r'\.?search\.')
@@ -81,6 +137,89 @@ def _unicode_parse_qs(qs, **kwargs):
     return unicode_query
 
 
+def _split_url(url):
+    """
+    A specialized ``urlparse.urlparse`` for ``http://`` and ``https://``
+    URLs which skips generic scheme handling and ``urlparse``'s internal
+    cache (which is cleared whenever it fills up so it rarely helps with
+    referrers).  Any other URL, and any netloc that ``urlparse`` would need
+    to validate further, is handed to ``urlparse`` so that results and
+    ``ValueError`` cases are identical.
+
+    :param url: A URL.
+    :type url:  ``unicode``
+
+    :returns: a :class:`urlparse.ParseResult`.
+    """
+    if url[:7] == u'http://':
+        scheme, start = u'http', 7
+    elif url[:8] == u'https://':
+        scheme, start = u'https', 8
+    else:
+        return urlparse(url)
+
+    # The netloc ends at the first '/', '?' or '#'
+    end = len(url)
+    for delim in u'/?#':
+        i = url.find(delim, start, end)
+        if i >= 0:
+            end = i
+    netloc = url[start:end]
+    if u'[' in netloc or u']' in netloc:
+        # IPv6 addresses
+        return urlparse(url)
+    try:
+        netloc.encode('ascii')
+    except UnicodeError:
+        # Non-ASCII netlocs are checked under NFKC normalization
+        return urlparse(url)
+
+    path = url[end:]
+    params = query = fragment = u''
+    if u'#' in path:
+        path, fragment = path.split(u'#', 1)
+    if u'?' in path:
+        path, query = path.split(u'?', 1)
+    if u';' in path:
+        # path always starts with a '/' here
+        i = path.find(u';', path.rfind(u'/'))
+        if i >= 0:
+            path, params = path[:i], path[i + 1:]
+
+    return tuple.__new__(ParseResult,
+                         (scheme, netloc, path, params, query, fragment))
+
+
+def _query_keys(qs):
+    """
+    The set of keys that ``_unicode_parse_qs(qs, keep_blank_values=True)``
+    would return, without unquoting or decoding any of the values.
+
+    :param qs: Percent-encoded query string to be parsed.
+    :type qs:  ``basestring``
+    """
+    is_unicode = isinstance(qs, unicode)
+    if is_unicode:
+        qs = qs.encode('utf-8', 'ignore')
+
+    keys = set()
+    for pairs in qs.split('&'):
+        for name_value in pairs.split(';'):
+            if not name_value:
+                continue
+            name = name_value.split('=', 1)[0]
+            if '+' in name:
+                name = name.replace('+', ' ')
+            if '%' in name:
+                name = unquote(name)
+            keys.add(name)
+
+    if is_unicode:
+        keys = set(key.decode('utf-8', 'ignore') for key in keys)
+        keys.discard(u'')
+    return keys
+
+
 def _unicode_urlparse(url, encoding='utf-8', errors='ignore'):
     """
     Safely parse a URL into a :class:`urlparse.ParseResult` ensuring that
@@ -97,23 +236,139 @@ def _unicode_urlparse(url, encoding='utf-8', errors='ignore'):
                      unicode given encoding (default is ignore).
     :type errors:    ``str``
     """
+    if _limits_enabled and isinstance(url, basestring):
+        max_length = _limits['max_url_length']
+        if max_length is not None and len(url) > max_length:
+            return _reject('max_url_length')
+
     if isinstance(url, str):
         url = url.decode(encoding, errors)
     elif isinstance(url, ParseResult):
         # Ensure every part is unicode because we can't rely on clients to do so
-        parts = list(url)
-        for i in range(len(parts)):
-            if isinstance(parts[i], str):
-                parts[i] = parts[i].decode(encoding, errors)
-        return ParseResult(*parts)
+        if any(isinstance(part, str) for part in url):
+            parts = list(url)
+            for i in range(len(parts)):
+                if isinstance(parts[i], str):
+                    parts[i] = parts[i].decode(encoding, errors)
+            url = ParseResult(*parts)
+        return _apply_limits(url, check_length=True) if _limits_enabled \
+            else url
 
     try:
-        return urlparse(url)
+        url_parts = _split_url(url)
     except ValueError:
         msg = u'Malformed URL "{}" could not parse'.format(url)
         log.debug(msg, exc_info=True)
         return None
 
+    return _apply_limits(url_parts) if _limits_enabled else url_parts
+
+
+def _reject(limit):
+    """Count a referrer rejected by ``limit``."""
+    _rejection_stats[limit] = _rejection_stats.get(limit, 0) + 1
+    return None
+
+
+def _truncate_query(qs, max_params):
+    """
+    Truncate a query string (or fragment) to its first ``max_params``
+    params, scanning no further than it needs to.
+    """
+    if qs.count('&') + qs.count(';') < max_params:
+        return qs
+    if max_params <= 0:
+        return qs[:0]
+    for i, match in enumerate(_query_separator_re.finditer(qs)):
+        if i == max_params - 1:
+            return qs[:match.start()]
+    return qs
+
+
+def _apply_limits(url_parts, check_length=False):
+    """
+    Apply the limits set with :func:`set_limits` to ``url_parts``.
+
+    :returns: ``url_parts`` (with its query string and fragment truncated if
+              need be) or ``None`` if it was rejected.
+    """
+    max_length = _limits['max_url_length']
+    if check_length and max_length is not None and \
+       sum(len(part) for part in url_parts) > max_length:
+        return _reject('max_url_length')
+
+    if _limits['validate_host']:
+        netloc = url_parts.netloc
+        if len(netloc) > _max_host_length or _invalid_host_re.search(netloc):
+            return _reject('validate_host')
+
+    max_params = _limits['max_query_params']
+    if max_params is not None:
+        query = _truncate_query(url_parts.query, max_params)
+        fragment = _truncate_query(url_parts.fragment, max_params)
+        if query is not url_parts.query or \
+           fragment is not url_parts.fragment:
+            _reject('max_query_params')
+            url_parts = url_parts._replace(query=query, fragment=fragment)
+
+    return url_parts
+
+
+def set_limits(max_url_length=None, max_query_params=None,
+               max_keyword_length=None, validate_host=False):
+    """
+    Bound the cost of parsing pathological referrers (e.g. multi-megabyte
+    URLs from bots).  Limits are enforced before a referrer is parsed any
+    further than splitting it, so rejected referrers never reach the lookup
+    caches.  Every call replaces all previously set limits and calling with
+    no arguments (the default state) disables them.  See
+    :func:`get_rejection_stats` for the number of referrers each limit has
+    rejected.
+
+    :param max_url_length:     Reject referrers longer than this.
+    :type max_url_length:      ``int`` or ``None``
+
+    :param max_query_params:   Only scan this many params of the query string
+                               and fragment for keywords.
+    :type max_query_params:    ``int`` or ``None``
+
+    :param max_keyword_length: Truncate keywords to this many characters.
+    :type max_keyword_length:  ``int`` or ``None``
+
+    :param validate_host:      Reject referrers whose ``netloc`` is
+                               implausibly long or contains characters that
+                               aren't allowed in a host.
+    :type validate_host:       ``True`` or ``False``
+    """
+    global _limits_enabled
+    _limits.update(max_url_length=max_url_length,
+                   max_query_params=max_query_params,
+                   max_keyword_length=max_keyword_length,
+                   validate_host=validate_host)
+    _limits_enabled = max_url_length is not None or \
+                      max_query_params is not None or \
+                      max_keyword_length is not None or validate_host
+
+
+def get_limits():
+    """
+    Return the limits set with :func:`set_limits`.
+
+    :returns: a ``dict`` of limit name to value.
+    """
+    return dict(_limits)
+
+
+def get_rejection_stats():
+    """
+    Return the number of referrers rejected by each of the limits set with
+    :func:`set_limits` since the module was loaded.  ``'max_query_params'``
+    and ``'max_keyword_length'`` count truncations rather than rejections.
+
+    :returns: a ``dict`` of limit name to number of referrers.
+    """
+    return dict(_rejection_stats)
+
 
 def _serp_query_string(parse_result):
     """
@@ -126,7 +381,7 @@ def _serp_query_string(parse_result):
     """
     query = parse_result.query
     if parse_result.fragment != '':
-        query = u'{}&{}'.format(query, parse_result.fragment)
+        query = query + u'&' + parse_result.fragment
 
     return query
 
@@ -141,25 +396,90 @@ def _is_url_without_path_query_or_fragment(url_parts):
     return url_parts.path.strip('/') == '' and url_parts.query == '' \
            and url_parts.fragment == ''
 
+def _get_shared_parser(parsers, engine_name, keyword_extractor, link_macro,
+                       charsets):
+    """
+    Return the :class:`SearchEngineParser` in ``parsers`` for the given
+    definition, creating it if this is the first time we've seen it.  This
+    way the hundreds of Piwik rules that share a definition (e.g. all of
+    Google's country domains) share a single parser.
+
+    :param parsers: A ``dict`` of definition to :class:`SearchEngineParser`.
+    :type parsers:  ``dict``
+    """
+    definition = (engine_name,
+                  keyword_extractor if isinstance(keyword_extractor, basestring)
+                  else tuple(keyword_extractor),
+                  link_macro,
+                  charsets if isinstance(charsets, basestring)
+                  else tuple(charsets))
+    try:
+        return parsers[definition]
+    except KeyError:
+        parser = SearchEngineParser(engine_name, keyword_extractor,
+                                    link_macro, charsets)
+        parsers[definition] = parser
+        return parser
+
+
+# Stable ids of parsers, see SearchEngineParser.engine_id
+_engine_ids = {}
+
+# md5 of search_engines.pickle (or of the engine profile in its place),
+# custom rules in the order they were added and the version derived from
+# them, see _get_engines_version
+_piwik_digest = None
+_profile_digest = None
+_custom_rules = []
+_engines_version = None
+
+# Whether lookups that miss in a loaded engine profile fall back to the full
+# list of engines, and the full list and its wildcard index when they do, see
+# load_engine_profile
+_profile_fallback = False
+_full_engines = None
+_full_wildcard_index = None
+
+# A LRUCache of (netloc, path) to the tier and engine key that resolve them
+# in the full list of engines, see _fallback_lookup
+_fallback_cache = pylru.lrucache(2000)
+
 _engines = None
 def _get_search_engines():
     """
     Convert the OrderedDict of search engine parsers that we get from Piwik
-    to a dictionary of SearchEngineParser objects.
+    to a dictionary of SearchEngineParser objects, unless an engine profile
+    has been loaded in its place (see :func:`load_engine_profile`).
 
     Cache this thing by storing in the global ``_engines``.
     """
     global _engines
-    if _engines:
+    if _engines is not None:
         return _engines
 
     piwik_engines = _get_piwik_engines()
+    _engines = _build_search_engines(piwik_engines)
+    # A parser's engine id is the first rule that maps to it
+    for domain in piwik_engines:
+        _engine_ids.setdefault(_engines[domain], domain)
+
+    return _engines
+
+
+def _build_search_engines(piwik_engines):
+    """
+    Build a ``dict`` of match rule to :class:`SearchEngineParser` from
+    Piwik's definitions.  Rules with identical definitions share one
+    :class:`SearchEngineParser` instance, so parsers returned by
+    :func:`get_parser` should be treated as read-only.
+    """
     # Engine names are the first param of each of the search engine arrays
     # so we group by those guys, and create our new dictionary with that
     # order
     get_engine_name = lambda x: x[1][0]
     definitions_by_engine = groupby(piwik_engines.iteritems(), get_engine_name)
-    _engines = {}
+    engines = {}
+    parsers = {}
 
     for engine_name, rule_group in definitions_by_engine:
         defaults = {
@@ -178,10 +498,10 @@ def _get_search_engines():
                 if len(rule) >= 3:
                     defaults['charsets'] = rule[2]
 
-                _engines[domain] = SearchEngineParser(engine_name,
-                                                      defaults['extractor'],
-                                                      defaults['link_macro'],
-                                                      defaults['charsets'])
+                engines[domain] = _get_shared_parser(parsers, engine_name,
+                                                     defaults['extractor'],
+                                                     defaults['link_macro'],
+                                                     defaults['charsets'])
                 continue
 
             # Default args for SearchEngineParser
@@ -196,9 +516,204 @@ def _get_search_engines():
             if len(rule) == 3:
                 args[3] = rule[2]
 
-            _engines[domain] = SearchEngineParser(*args)
+            engines[domain] = _get_shared_parser(parsers, *args)
 
-    return _engines
+    return engines
+
+
+def _get_path_rule_hosts():
+    """
+    Return the set of hosts which have at least one match rule that includes
+    a path (e.g. ``google.{}`` for ``google.{}/cse``).  Lookup plans use this
+    to skip the ``<domain><path>`` probes for all other hosts.
+
+    Cache this thing by storing in the global ``_path_rule_hosts``.
+    """
+    global _path_rule_hosts
+    if _path_rule_hosts is None:
+        _path_rule_hosts = set(key.split(u'/', 1)[0]
+                               for key in _get_search_engines()
+                               if u'/' in key and u'*' not in key)
+    return _path_rule_hosts
+
+
+def _parse_wildcard_rule(match_rule):
+    """
+    Split a wildcard match rule into the kind of rule and the pattern it
+    matches, see :func:`add_custom_parser`.
+
+    :returns: a ``(kind, pattern)`` tuple where ``kind`` is ``'host'``,
+              ``'path'`` or ``'query'``, or ``None`` if ``match_rule`` isn't
+              a wildcard rule.
+    """
+    if u'*' not in match_rule:
+        return None
+    if match_rule[:2] == u'*.':
+        kind, pattern = 'host', match_rule[1:]
+        if pattern == u'.' or u'/' in pattern or u'?' in pattern:
+            pattern = u'*'  # Invalid
+    elif match_rule[:1] == u'/' and match_rule[-1:] == u'*':
+        kind, pattern = 'path', match_rule[:-1]
+    elif match_rule[:1] == u'?' and match_rule[-1:] == u'*':
+        kind, pattern = 'query', match_rule[1:-1]
+    else:
+        kind, pattern = None, u'*'
+
+    if kind is None or not pattern or u'*' in pattern:
+        raise ValueError(u'Invalid wildcard match rule "{}", expected '
+                         u'"*.<host suffix>", "/<path prefix>*" or '
+                         u'"?<query prefix>*"'.format(match_rule))
+    return kind, pattern
+
+
+# Special cases of the lookup expressed as wildcard rules which map to the
+# engine key of an existing rule
+_builtin_wildcard_rules = (
+    # Google custom search engine
+    (u'?cx=partner-pub*', u'google.com/cse'),
+    # private-label search powered by InfoSpace Metasearch
+    (u'/pemonitorhosted/ws/results/*', u'wsdsold.infospace.com'),
+    # Yahoo! Images
+    (u'*.images.search.yahoo.com', u'images.search.yahoo.com'),
+    # Yahoo!
+    (u'*.search.yahoo.com', u'search.yahoo.com'),
+)
+
+# Built-in host rules which, as in the original lookup, match hosts that
+# contain the pattern anywhere rather than only at the end
+_builtin_substring_host_rules = frozenset((u'*.images.search.yahoo.com',
+                                           u'*.search.yahoo.com'))
+
+
+class _WildcardIndex(object):
+    """Host suffix, path prefix and query prefix match rules indexed by
+    pattern.
+
+    Each kind of rule is a ``dict`` of pattern to engine key plus the
+    distinct pattern lengths, longest first.  Matching slices one candidate
+    per length and probes the ``dict``, so the cost depends on how many
+    distinct lengths there are rather than how many rules.  The few
+    substring host rules are searched for one by one instead.  The longest
+    matching pattern wins.
+    """
+    __slots__ = ('hosts', 'host_lengths', 'host_substrings', 'paths',
+                 'path_lengths', 'queries', 'query_lengths')
+
+    def __init__(self, rules, substring_host_rules=frozenset()):
+        """
+        :param rules: Wildcard match rules and the engine key each one maps
+                      to, later rules replace earlier ones with the same
+                      pattern.
+        :type rules:  iterable of ``(match_rule, engine_key)`` tuples
+
+        :param substring_host_rules: Host rules in ``rules`` which match
+                                     hosts containing their pattern anywhere
+                                     rather than ending with it.
+        :type substring_host_rules:  ``frozenset``
+        """
+        self.hosts = {}
+        self.host_substrings = {}
+        self.paths = {}
+        self.queries = {}
+        by_kind = {'host': self.hosts, 'path': self.paths,
+                   'query': self.queries}
+        for match_rule, engine_key in rules:
+            kind, pattern = _parse_wildcard_rule(match_rule)
+            if match_rule in substring_host_rules:
+                self.host_substrings[pattern] = engine_key
+            else:
+                by_kind[kind][pattern] = engine_key
+
+        lengths = lambda patterns: sorted(set(len(p) for p in patterns),
+                                          reverse=True)
+        self.host_lengths = lengths(self.hosts)
+        self.path_lengths = lengths(self.paths)
+        self.query_lengths = lengths(self.queries)
+
+    def _match_host_suffix(self, netloc):
+        """The length and engine key of the longest host suffix rule that
+        the host of ``netloc`` (without any port) ends with."""
+        host = netloc
+        i = host.rfind(u':')
+        if i > host.rfind(u']'):
+            host = host[:i]
+        for length in self.host_lengths:
+            if len(host) > length:
+                engine_key = self.hosts.get(host[-length:])
+                if engine_key is not None:
+                    return length, engine_key
+        return 0, None
+
+    def _match_host_substring(self, netloc):
+        """The length and engine key of the longest substring host rule that
+        ``netloc`` contains, the one found first on a tie."""
+        # Only a couple of built-in rules match this way, so searching for
+        # each pattern beats slicing the host at every '.'
+        length, index, engine_key = 0, -1, None
+        for pattern, key in self.host_substrings.iteritems():
+            if len(pattern) < length:
+                continue
+            i = netloc.find(pattern)
+            if i >= 0 and (len(pattern) > length or i < index):
+                length, index, engine_key = len(pattern), i, key
+        return length, engine_key
+
+    def match_host(self, netloc):
+        """The engine key of the longest host rule that matches ``netloc``,
+        or ``None``."""
+        length, engine_key = 0, None
+        if self.hosts:
+            length, engine_key = self._match_host_suffix(netloc)
+        if self.host_substrings:
+            substring_length, substring_key = \
+                self._match_host_substring(netloc)
+            if substring_length > length:
+                engine_key = substring_key
+        return engine_key
+
+    def match_path(self, path):
+        """The engine key of the longest path prefix rule that ``path``
+        starts with, or ``None``."""
+        for length in self.path_lengths:
+            engine_key = self.paths.get(path[:length])
+            if engine_key is not None:
+                return engine_key
+        return None
+
+    def match_query(self, query):
+        """The engine key of the longest query prefix rule that ``query``
+        (see :func:`_serp_query_string`) starts with, or ``None``."""
+        for length in self.query_lengths:
+            engine_key = self.queries.get(query[:length])
+            if engine_key is not None:
+                return engine_key
+        return None
+
+
+def _build_wildcard_index(engines):
+    """
+    Build the :class:`_WildcardIndex` of the built-in special cases whose
+    engine key is in ``engines`` and every wildcard rule in ``engines``.
+    """
+    rules = [(match_rule, engine_key)
+             for match_rule, engine_key in _builtin_wildcard_rules
+             if engine_key in engines]
+    substring_host_rules = frozenset(match_rule for match_rule, _ in rules
+                                     if match_rule in
+                                     _builtin_substring_host_rules)
+    rules += [(key, key) for key in engines if u'*' in key]
+    return _WildcardIndex(rules, substring_host_rules)
+
+
+def _get_wildcard_index():
+    """
+    Return the :class:`_WildcardIndex` of the built-in special cases and
+    every wildcard rule added with :func:`add_custom_parser`.
+    """
+    global _wildcard_index
+    if _wildcard_index is None:
+        _wildcard_index = _build_wildcard_index(_get_search_engines())
+    return _wildcard_index
 
 
 def _get_piwik_engines():
@@ -206,11 +721,48 @@ def _get_piwik_engines():
     Return the search engine parser definitions stored in this module. We don't
     cache this result since it's only supposed to be called once.
     """
+    _piwik_engines = pickle.loads(_read_piwik_pickle())
+
+    return _piwik_engines
+
+
+def _read_piwik_pickle():
+    """
+    Return the bytes of ``search_engines.pickle``, and store their digest
+    in ``_piwik_digest``.
+    """
+    global _piwik_digest
     stream = pkg_resources.resource_stream
     with stream(__name__, 'search_engines.pickle') as picklestream:
-        _piwik_engines = pickle.load(picklestream)
+        data = picklestream.read()
+    _piwik_digest = hashlib.md5(data).hexdigest()
+    return data
 
-    return _piwik_engines
+
+def _get_engines_version():
+    """
+    Return a digest of ``search_engines.pickle`` (or the loaded engine
+    profile, plus ``search_engines.pickle`` if it falls back to it) and
+    every custom parser added with :func:`add_custom_parser`, which changes
+    whenever the results :func:`extract` returns might.  Used to invalidate
+    persistent caches.
+    """
+    global _engines_version
+    if _engines_version is None:
+        _get_search_engines()
+        if _profile_digest is None:
+            digest = hashlib.md5(_piwik_digest)
+        else:
+            digest = hashlib.md5(_profile_digest)
+            if _profile_fallback:
+                # Misses are resolved with the full list of engines
+                if _piwik_digest is None:
+                    _read_piwik_pickle()
+                digest.update(_piwik_digest)
+        for match_rule, definition in _custom_rules:
+            digest.update(repr((match_rule, definition)))
+        _engines_version = digest.hexdigest()
+    return _engines_version
 
 
 _get_lossy_domain_regex = None
@@ -224,8 +776,10 @@ def _get_lossy_domain(domain):
     """
     global _domain_cache, _get_lossy_domain_regex
 
-    if domain in _domain_cache:
-        return _domain_cache[domain]
+    with _cache_lock:
+        output = _domain_cache.get(domain)
+    if output is not None:
+        return output
 
     if not _get_lossy_domain_regex:
         codes = '|'.join(_country_codes)
@@ -242,10 +796,24 @@ def _get_lossy_domain(domain):
     output = u'%s%s%s' % ('{}.' if res['ccsub'] else '',
                           res['domain'],
                           '.{}' if res['tldcc'] else res['tld'] or '')
-    _domain_cache[domain] = output # Add to LRU cache
+    with _cache_lock:
+        _domain_cache[domain] = output # Add to LRU cache
     return output
 
 
+def _get_parser_by_id(engine_id):
+    """
+    Return the parser for a :attr:`SearchEngineParser.engine_id`.  Used to
+    unpickle parsers.
+    """
+    try:
+        return _get_search_engines()[engine_id]
+    except KeyError:
+        if _profile_fallback and engine_id in _get_full_engines():
+            return _full_engines[engine_id]
+        raise ValueError(u'Unknown engine id "{}"'.format(engine_id))
+
+
 class ExtractResult(object):
     __slots__ = ('engine_name', 'keyword', 'parser')
 
@@ -254,6 +822,10 @@ class ExtractResult(object):
         self.keyword = keyword
         self.parser = parser
 
+    def __reduce__(self):
+        # Parsers pickle by engine id, see SearchEngineParser.__reduce__
+        return (ExtractResult, (self.engine_name, self.keyword, self.parser))
+
     def __repr__(self):
         repr_fmt = 'ExtractResult(engine_name={!r}, keyword={!r}, parser={!r})'
         return repr_fmt.format(self.engine_name, self.keyword, self.parser)
@@ -298,17 +870,65 @@ class SearchEngineParser(object):
             keyword_extractor = [keyword_extractor]
         self.keyword_extractor = keyword_extractor[:]
         for i, extractor in enumerate(self.keyword_extractor):
-            # Pre-compile all the regular expressions
+            # Pre-compile all the regular expressions, once per pattern
             if extractor.startswith('/'):
                 extractor = extractor.strip('/')
-                extractor = re.compile(extractor)
-                self.keyword_extractor[i] = extractor
+                if extractor not in _extractor_regexes:
+                    _extractor_regexes[extractor] = re.compile(extractor)
+                self.keyword_extractor[i] = _extractor_regexes[extractor]
 
         self.link_macro = link_macro
         if isinstance(charsets, basestring):
             charsets = [charsets]
         self.charsets = [c.lower() for c in charsets]
 
+    @property
+    def engine_id(self):
+        """
+        A stable id for this parser which can be used to look it up again in
+        another process, or ``None`` if it isn't in the list of parsers
+        that :func:`get_parser` uses.  Parsers from Piwik's list use the first
+        rule that maps to them, custom parsers the ``match_rule`` they were
+        added with, see :func:`add_custom_parser`.
+        """
+        engine_id = _engine_ids.get(self)
+        if engine_id is None:
+            return None
+        if _engines.get(engine_id) is self:
+            return engine_id
+        if _full_engines is not None and _full_engines.get(engine_id) is self:
+            return engine_id
+        return None
+
+    def get_definition(self):
+        """
+        Return the arguments that create a copy of this parser.
+
+        :returns: an ``(engine_name, keyword_extractor, link_macro,
+                  charsets)`` tuple.
+        """
+        keyword_extractor = [e if isinstance(e, basestring)
+                             else u'/{}/'.format(e.pattern)
+                             for e in self.keyword_extractor]
+        return (self.engine_name, keyword_extractor, self.link_macro,
+                self.charsets[:])
+
+    def __reduce__(self):
+        # Parsers that get_parser knows about are pickled by reference so
+        # that results don't drag their extractors and regexes along
+        engine_id = self.engine_id
+        if engine_id is not None:
+            return (_get_parser_by_id, (engine_id,))
+        return (SearchEngineParser, self.get_definition())
+
+    def __copy__(self):
+        # Unlike pickling, copies are new parsers which can be changed
+        # without changing the shared one that get_parser returns
+        return SearchEngineParser(*self.get_definition())
+
+    def __deepcopy__(self, memo):
+        return self.__copy__()
+
     def get_serp_url(self, base_url, keyword):
         """
         Get a URL to a SERP for a given keyword.
@@ -320,6 +940,8 @@ class SearchEngineParser(object):
         :type keyword:   ``str``
 
         :returns: a URL that links directly to a SERP for the given keyword.
+                  The keyword isn't percent-encoded, see :func:`get_serp_urls`
+                  to build many properly encoded links at once.
         """
         if self.link_macro is None:
             return None
@@ -427,6 +1049,50 @@ class SearchEngineParser(object):
         if keyword is not None:
             return ExtractResult(engine_name, keyword, self)
 
+    def is_serp(self, url_parts):
+        """
+        Determine whether :meth:`parse` would find a keyword in a SERP URL
+        while doing as little of the work of extracting it as possible.  Only
+        the keys of the query string are parsed, except for the Google edge
+        cases which depend on query string values.
+
+        :param url_parts: The SERP URL
+        :type url_parts:  A :class:`urlparse.ParseResult` with all elements
+                          as unicode
+
+        :returns: ``True`` if :meth:`parse` would return an
+                  :class:`ExtractResult`, ``False`` otherwise.
+        """
+        engine_name = self.engine_name
+        original_query = _serp_query_string(url_parts)
+        if engine_name == 'Google Images' or \
+           (engine_name == 'Google' and ('/imgres' in original_query or
+                                         'as_' in original_query)):
+            return self.parse(url_parts) is not None
+
+        keys = _query_keys(original_query)
+        if engine_name == 'Google' and 'tbm' in keys:
+            # The top bar menu can change the engine name
+            return self.parse(url_parts) is not None
+
+        found = False
+        for extractor in self.keyword_extractor:
+            if not isinstance(extractor, basestring):
+                match = extractor.search(url_parts.path)
+                if match:
+                    found = match.group(1) is not None
+                    break
+            elif extractor in keys:
+                found = True
+            elif not found and extractor == 'q':
+                # A SERP with no keyword, see parse
+                if engine_name == 'DuckDuckGo' or \
+                   (engine_name == 'Google' and
+                    _is_url_without_path_query_or_fragment(url_parts)):
+                    found = True
+
+        return found
+
     def __repr__(self):
         repr_fmt = ("SearchEngineParser(engine_name={!r}, "
                     "keyword_extractor={!r}, link_macro={!r}, charsets={!r})")
@@ -437,24 +1103,524 @@ class SearchEngineParser(object):
                         self.charsets)
 
 
+class _LookupPlan(object):
+    """The memoized outcome of the host-only part of :func:`get_parser`'s
+    lookup for a single ``netloc``.
+
+    Every tier of the fixed lookup precedence that depends on the host alone
+    is resolved once when the plan is built, so repeat lookups for the same
+    host only probe the ``<domain><path>`` rules when the host actually has
+    any, then go straight to the engine key (or negative result) recorded
+    here.
+    """
+    __slots__ = ('domain', 'lossy_domain', 'adaptive', 'domain_paths',
+                 'lossy_paths', 'root_tier', 'root_key', 'host_tier',
+                 'host_key', 'fallback_tier', 'fallback_key')
+
+    def __init__(self, engines, domain):
+        self.domain = domain
+        self.lossy_domain = lossy_domain = _get_lossy_domain(domain)
+        # Hosts that are blank or contain a '/' (only possible when passed a
+        # hand-built ParseResult) can match a rule with a path in ways that
+        # a plan can't capture so we leave them to the fixed lookup, as we do
+        # for paths that don't start with a '/'.
+        self.adaptive = domain != '' and u'/' not in domain
+
+        path_rule_hosts = _get_path_rule_hosts()
+        self.domain_paths = domain in path_rule_hosts
+        self.lossy_paths = lossy_domain in path_rule_hosts
+
+        # With an empty path, tiers 1. and 2. probe the bare domains
+        if domain in engines:
+            self.root_tier, self.root_key = 'domain+path', domain
+        elif lossy_domain in engines:
+            self.root_tier, self.root_key = 'lossy_domain+path', lossy_domain
+        else:
+            self.root_tier, self.root_key = None, None
+
+        if lossy_domain in engines:
+            self.host_tier, self.host_key = 'lossy_domain', lossy_domain
+        elif domain in engines:
+            self.host_tier, self.host_key = 'domain', domain
+        else:
+            self.host_tier, self.host_key = None, None
+
+        # A host rule always wins over the wildcard tiers, see resolve
+        if self.host_key is None:
+            self.fallback_key = _get_wildcard_index().match_host(domain)
+        else:
+            self.fallback_key = None
+        self.fallback_tier = 'host_suffix' if self.fallback_key else None
+
+    def is_current(self, engines):
+        """Whether the engine keys this plan resolves to are still in
+        ``engines``."""
+        return (self.root_key is None or self.root_key in engines) and \
+               (self.host_key is None or self.host_key in engines) and \
+               (self.fallback_key is None or self.fallback_key in engines)
+
+    def resolve(self, engines, url_parts):
+        """
+        Find the engine key for ``url_parts`` whose ``netloc`` is the host
+        this plan was built for.
+
+        :returns: a ``(tier, engine_key)`` tuple, both ``None`` if no rule
+                  matches.
+        """
+        path = url_parts.path
+        if path:
+            if self.domain_paths and self.domain + path in engines:
+                return 'domain+path', self.domain + path
+            if self.lossy_paths and self.lossy_domain + path in engines:
+                return 'lossy_domain+path', self.lossy_domain + path
+            if self.host_key is not None:
+                return self.host_tier, self.host_key
+        elif self.root_key is not None:
+            return self.root_tier, self.root_key
+
+        index = _get_wildcard_index()
+        engine_key = index.match_query(_serp_query_string(url_parts))
+        if engine_key is not None:
+            return 'query_prefix', engine_key
+        engine_key = index.match_path(path)
+        if engine_key is not None:
+            return 'path_prefix', engine_key
+        return self.fallback_tier, self.fallback_key
+
+
+def _get_plan(engines, domain):
+    """
+    Return the :class:`_LookupPlan` for ``domain``, building and caching a
+    new one if needed.
+    """
+    global _plan_cache
+
+    with _cache_lock:
+        plan = _plan_cache.get(domain)
+    if plan is not None and plan.is_current(engines):
+        return plan
+
+    plan = _LookupPlan(engines, domain)
+    with _cache_lock:
+        _plan_cache[domain] = plan
+    return plan
+
+
+def _fixed_lookup(engines, url_parts, index=None):
+    """
+    Find the engine key for ``url_parts`` by probing every tier of match
+    rules in order, see :func:`get_parser`.  ``index`` is the
+    :class:`_WildcardIndex` for ``engines`` if they aren't the current
+    engines.
+
+    :returns: a ``(tier, engine_key)`` tuple, both ``None`` if no rule
+              matches.
+    """
+    query = _serp_query_string(url_parts)
+
+    domain = url_parts.netloc
+    path = url_parts.path
+    lossy_domain = _get_lossy_domain(url_parts.netloc)
+
+    if u'{}{}'.format(domain, path) in engines:
+        return 'domain+path', u'{}{}'.format(domain, path)
+    elif u'{}{}'.format(lossy_domain, path) in engines:
+        return 'lossy_domain+path', u'{}{}'.format(lossy_domain, path)
+    elif lossy_domain in engines:
+        return 'lossy_domain', lossy_domain
+    elif domain in engines:
+        return 'domain', domain
+
+    if index is None:
+        index = _get_wildcard_index()
+    engine_key = index.match_query(query)
+    if engine_key is not None:
+        return 'query_prefix', engine_key
+    engine_key = index.match_path(path)
+    if engine_key is not None:
+        return 'path_prefix', engine_key
+    engine_key = index.match_host(domain)
+    if engine_key is not None:
+        return 'host_suffix', engine_key
+
+    return None, None
+
+
+def _lookup(engines, url_parts, adaptive=True):
+    """
+    Find the engine key for ``url_parts``.  Callers count the lookup with
+    :func:`_count_lookup`.
+
+    :returns: a ``(tier, engine_key)`` tuple, both ``None`` if no rule
+              matches.
+    """
+    # Try to find a parser in the engines list.  We go from most specific to
+    # least specific order:
+    # 1. <domain><path>
+    # 2. <lossy_domain><path>
+    # 3. <lossy_domain>
+    # 4. <domain>
+    # 5. ?<query prefix>*
+    # 6. /<path prefix>*
+    # 7. *.<host suffix>
+    # The last three are wildcard rules which include the special cases for
+    # Google custom search engines, InfoSpace, yahoo and yahoo images
+    if adaptive:
+        plan = _get_plan(engines, url_parts.netloc)
+        if plan.adaptive and url_parts.path[:1] in ('', '/'):
+            tier, engine_key = plan.resolve(engines, url_parts)
+        else:
+            tier, engine_key = _fixed_lookup(engines, url_parts)
+    else:
+        tier, engine_key = _fixed_lookup(engines, url_parts)
+
+    return tier, engine_key
+
+
+def _get_full_engines():
+    """
+    Return the full list of engines that a loaded engine profile falls back
+    to, building it (and its wildcard index) the first time.
+    """
+    global _full_engines, _full_wildcard_index
+    if _full_engines is None:
+        piwik_engines = _get_piwik_engines()
+        _full_engines = _build_search_engines(piwik_engines)
+        _full_wildcard_index = _build_wildcard_index(_full_engines)
+        for domain in piwik_engines:
+            _engine_ids.setdefault(_full_engines[domain], domain)
+    return _full_engines
+
+
+def _fallback_lookup(url_parts):
+    """
+    Find the engine key for ``url_parts`` in the full list of engines after
+    a miss in a loaded engine profile, see :func:`load_engine_profile`.
+
+    :returns: a ``('fallback', engine_key)`` tuple, or ``(None, None)`` if no
+              rule matches.
+    """
+    engines = _get_full_engines()
+    key = (url_parts.netloc, url_parts.path)
+    with _cache_lock:
+        cached = _fallback_cache.get(key)
+    if cached is None:
+        # Only query prefix rules look at the query string, see BatchPlan
+        cached = _fixed_lookup(
+            engines, url_parts._replace(query=u'', fragment=u''),
+            _full_wildcard_index)
+        with _cache_lock:
+            _fallback_cache[key] = cached
+    tier, engine_key = cached
+
+    if tier not in _host_path_tiers:
+        query_key = _full_wildcard_index.match_query(
+            _serp_query_string(url_parts))
+        if query_key is not None:
+            engine_key = query_key
+    if engine_key is None:
+        return None, None
+    return 'fallback', engine_key
+
+
+def _count_lookup(tier, engine_key, count=1):
+    """Count ``count`` lookups resolved by ``tier`` to ``engine_key``."""
+    _lookup_stats[tier] = _lookup_stats.get(tier, 0) + count
+    if engine_key is not None:
+        _rule_stats[engine_key] = _rule_stats.get(engine_key, 0) + count
+
+
+def get_lookup_stats():
+    """
+    Return the number of :func:`get_parser` lookups resolved by each tier of
+    match rules since the module was loaded.  Tiers are ``'domain+path'``,
+    ``'lossy_domain+path'``, ``'lossy_domain'``, ``'domain'``,
+    ``'query_prefix'``, ``'path_prefix'`` and ``'host_suffix'`` with ``None``
+    counting lookups that found no parser and ``'fallback'`` ones that were
+    only found by falling back from an engine profile to the full list.
+
+    :returns: a ``dict`` of tier to number of lookups.
+    """
+    return dict(_lookup_stats)
+
+
+def get_rule_stats():
+    """
+    Return the number of :func:`get_parser` lookups resolved by each match
+    rule since the module was loaded, see :func:`save_engine_profile`.
+
+    :returns: a ``dict`` of match rule to number of lookups.
+    """
+    return dict(_rule_stats)
+
+
 def add_custom_parser(match_rule, parser):
     """
     Add a custom search engine parser to the cached ``_engines`` list.
 
+    Besides exact domain/path rules, a match rule can be a wildcard which
+    :func:`get_parser` tries, in this order, when no exact rule matches:
+
+    * ``?<prefix>*`` matches URLs whose query string starts with ``prefix``
+    * ``/<prefix>*`` matches URLs whose path starts with ``/<prefix>``
+    * ``*.<suffix>`` matches URLs whose host (without any port) ends with
+      ``.<suffix>``, i.e. any subdomain of ``suffix``
+
+    The longest pattern of each kind wins, and lookups stay as fast however
+    many wildcard rules are added.
+
     :param match_rule: A match rule which is used by :func:`get_parser` to look
                        up a parser for a given domain/path.
     :type match_rule:  ``unicode``
 
     :param parser:     A custom parser.
     :type parser:      :class:`SearchEngineParser`
+
+    :raises: ``ValueError`` if ``match_rule`` is an invalid wildcard rule.
     """
     assert isinstance(match_rule, unicode)
     assert isinstance(parser, SearchEngineParser)
 
-    global _engines
+    global _engines, _path_rule_hosts, _engines_version, _wildcard_index
+    _parse_wildcard_rule(match_rule)  # Validate before changing anything
     _get_search_engines()  # Ensure that the default engine list is loaded
 
     _engines[match_rule] = parser
+    _engine_ids.setdefault(parser, match_rule)
+    _custom_rules.append((match_rule, parser.get_definition()))
+    _engines_version = None
+    # The new rule may take precedence over existing lookup plans
+    with _cache_lock:
+        _plan_cache.clear()
+    _path_rule_hosts = None
+    if u'*' in match_rule:
+        _wildcard_index = None
+
+
+_profile_format = 1
+
+
+def save_engine_profile(filename, min_hits=1, rule_hits=None):
+    """
+    Save the match rules that resolved at least ``min_hits`` lookups, and
+    their parsers, as an engine profile that :func:`load_engine_profile` can
+    load in place of the full list of engines.  Record a profile by running
+    a representative corpus of referrers through :func:`get_parser` (or any
+    function that uses it) first.
+
+    :param filename:  Where to save the profile (as JSON).
+    :type filename:   ``str``
+
+    :param min_hits:  Leave out rules that resolved fewer lookups.
+    :type min_hits:   ``int``
+
+    :param rule_hits: Number of lookups per match rule, defaults to
+                      :func:`get_rule_stats`.
+    :type rule_hits:  ``dict``
+
+    :returns: the number of rules saved.
+    """
+    if rule_hits is None:
+        rule_hits = _rule_stats
+    engines = _get_search_engines()
+    rules = []
+    for match_rule, hits in sorted(rule_hits.iteritems(),
+                                   key=lambda x: (-x[1], x[0])):
+        if hits < min_hits:
+            continue
+        parser = engines.get(match_rule)
+        if parser is None:
+            parser = _get_full_engines().get(match_rule)
+        if parser is None:
+            raise ValueError(u'Unknown match rule "{}"'.format(match_rule))
+        engine_name, extractor, link_macro, charsets = parser.get_definition()
+        rules.append({'rule': match_rule, 'hits': hits,
+                      'engine_name': engine_name, 'extractor': extractor,
+                      'link_macro': link_macro, 'charsets': charsets})
+
+    profile = {'format': _profile_format, 'source': _get_engines_version(),
+               'rules': rules}
+    with open(filename, 'wb') as f:
+        json.dump(profile, f, indent=1, sort_keys=True)
+    return len(rules)
+
+
+def _reset_engines(engines, digest, fallback):
+    """
+    Swap the list of engines that :func:`get_parser` uses for ``engines``
+    (``None`` to reload Piwik's list) and drop everything derived from the
+    old one, including custom parsers.
+    """
+    global _engines, _profile_digest, _profile_fallback, _full_engines, \
+           _full_wildcard_index, _custom_rules, _engines_version, \
+           _path_rule_hosts, _wildcard_index
+    _engines = engines
+    _profile_digest = digest
+    _profile_fallback = fallback
+    _full_engines = _full_wildcard_index = None
+    _custom_rules = []
+    _engines_version = None
+    _engine_ids.clear()
+    with _cache_lock:
+        _plan_cache.clear()
+        _fallback_cache.clear()
+    _path_rule_hosts = None
+    _wildcard_index = None
+
+
+def load_engine_profile(filename, fallback=False):
+    """
+    Load an engine profile saved by :func:`save_engine_profile` in place of
+    the full list of engines.  Only its match rules are loaded, which takes
+    less memory and time than loading Piwik's list of engines.  Custom
+    parsers added with :func:`add_custom_parser` before loading are dropped.
+
+    Referrers resolve to the same parser as with the full list as long as
+    their rule is in the profile.  Those that don't match any rule in the
+    profile are looked up in the full list if ``fallback`` is ``True`` (the
+    full list is only loaded on the first such miss), and counted as the
+    ``'fallback'`` tier by :func:`get_lookup_stats`.
+
+    :param filename: A profile saved by :func:`save_engine_profile`.
+    :type filename:  ``str``
+
+    :param fallback: Look up misses in the full list of engines.
+    :type fallback:  ``True`` or ``False``
+
+    :returns: a ``dict`` of match rule to the number of lookups it resolved
+              when the profile was recorded.
+
+    :raises: ``ValueError`` if ``filename`` isn't an engine profile.
+    """
+    with open(filename, 'rb') as f:
+        data = f.read()
+    try:
+        profile = json.loads(data)
+        if profile['format'] != _profile_format:
+            raise ValueError(u'Unsupported profile format {!r}'.format(
+                profile['format']))
+        engines = {}
+        parsers = {}
+        rule_hits = {}
+        for rule in profile['rules']:
+            engines[rule['rule']] = _get_shared_parser(
+                parsers, rule['engine_name'], rule['extractor'],
+                rule['link_macro'], rule['charsets'])
+            rule_hits[rule['rule']] = rule['hits']
+    except (KeyError, TypeError) as e:
+        raise ValueError(u'Invalid engine profile: {!r}'.format(e))
+
+    digest = hashlib.md5(data)
+    digest.update(repr(bool(fallback)))
+    _reset_engines(engines, digest.hexdigest(), bool(fallback))
+    # A parser's engine id is the first rule in the profile that maps to it,
+    # which is also a rule in the full list
+    for rule in profile['rules']:
+        _engine_ids.setdefault(engines[rule['rule']], rule['rule'])
+    return rule_hits
+
+
+def unload_engine_profile():
+    """
+    Go back to the full list of engines after :func:`load_engine_profile`.
+    Custom parsers added since loading the profile are dropped.
+    """
+    _reset_engines(None, None, False)
+
+
+def _parser_ref(parser):
+    """
+    A ``marshal``-able reference to ``parser``: its
+    :attr:`SearchEngineParser.engine_id` or, for parsers that aren't
+    registered, a tuple of its definition.  ``None`` for no parser.
+    """
+    if parser is None:
+        return None
+    ref = parser.engine_id
+    if ref is None:
+        engine_name, extractor, link_macro, charsets = parser.get_definition()
+        ref = (engine_name, tuple(extractor), link_macro, tuple(charsets))
+    return ref
+
+
+def _parser_from_ref(ref):
+    """Return the parser for a reference made by :func:`_parser_ref`."""
+    if ref is None:
+        return None
+    if isinstance(ref, tuple):
+        engine_name, extractor, link_macro, charsets = ref
+        return SearchEngineParser(engine_name, list(extractor), link_macro,
+                                  list(charsets))
+    return _get_parser_by_id(ref)
+
+
+# Version of the format written by dump_results
+_results_format = 1
+
+
+def dump_results(results):
+    """
+    Serialize a sequence of :func:`extract` results (``None`` included) into
+    a compact string for bulk transfer between processes on the same
+    machine.  Parsers are stored once per distinct
+    :attr:`SearchEngineParser.engine_id` (or definition for custom parsers)
+    and each distinct result once, so every result costs a single packed
+    index.
+
+    :param results: Results to serialize.
+    :type results:  iterable of :class:`ExtractResult` or ``None``
+
+    :returns: a ``str`` that :func:`load_results` turns back into results.
+    """
+    parsers = {None: -1}
+    refs = []
+    distinct = {}
+    table = []
+    rows = array('i')
+    for result in results:
+        if result is None:
+            rows.append(-1)
+            continue
+
+        engine_name, keyword, parser = \
+            result.engine_name, result.keyword, result.parser
+        key = (engine_name, keyword, parser)
+        index = distinct.get(key)
+        if index is None:
+            ref_index = parsers.get(parser)
+            if ref_index is None:
+                ref_index = parsers[parser] = len(refs)
+                refs.append(_parser_ref(parser))
+            index = distinct[key] = len(table)
+            table.append((engine_name, keyword, ref_index))
+        rows.append(index)
+
+    return marshal.dumps((_results_format, refs, table, rows.tostring()))
+
+
+def load_results(data):
+    """
+    Deserialize results written by :func:`dump_results`, resolving parsers
+    by engine id.  Every result is a new :class:`ExtractResult`, even where
+    equal results were only written once, since results are mutable.
+
+    :param data: A string written by :func:`dump_results`.
+    :type data:  ``str``
+
+    :returns: a ``list`` of :class:`ExtractResult` instances (or ``None``).
+    """
+    version, refs, table, rows = marshal.loads(data)
+    if version != _results_format:
+        raise ValueError(u'Unsupported results format {}'.format(version))
+
+    parsers = [_parser_from_ref(ref) for ref in refs]
+    distinct = [(engine_name, keyword,
+                 parsers[ref_index] if ref_index >= 0 else None)
+                for engine_name, keyword, ref_index in table]
+    indexes = array('i')
+    indexes.fromstring(rows)
+    return [ExtractResult(*distinct[index]) if index >= 0 else None
+            for index in indexes]
 
 
 def get_all_query_params():
@@ -475,57 +1641,35 @@ def get_all_query_params():
     return list(all_params)
 
 
-def get_parser(referring_url):
+def get_parser(referring_url, adaptive=True):
     """
     Utility function to find a parser for a referring URL if it is a SERP.
 
     :param referring_url: Suspected SERP URL.
     :type referring_url:  ``str`` or :class:`urlparse.ParseResult`
 
+    :param adaptive:      Use a memoized per-host lookup plan so that repeat
+                          hosts go straight to the tier of match rules that
+                          resolves them.  Results are identical either way.
+    :type adaptive:       ``True`` or ``False``
+
     :returns: :class:`SearchEngineParser` object if one exists for URL,
-              ``None`` otherwise.
+              ``None`` otherwise.  Parsers are shared by every rule with the
+              same definition (e.g. all of Google's country domains), so
+              treat them as read-only and ``copy.copy`` one to customise it.
     """
     engines = _get_search_engines()
     url_parts = _unicode_urlparse(referring_url)
     if url_parts is None:
         return None
 
-    query = _serp_query_string(url_parts)
-
-    domain = url_parts.netloc
-    path = url_parts.path
-    lossy_domain = _get_lossy_domain(url_parts.netloc)
-    engine_key = url_parts.netloc
-
-    # Try to find a parser in the engines list.  We go from most specific to
-    # least specific order:
-    # 1. <domain><path>
-    # 2. <lossy_domain><path>
-    # 3. <lossy_domain>
-    # 4. <domain>
-    # The final case has some special exceptions for things like Google custom
-    # search engines, yahoo and yahoo images
-    if u'{}{}'.format(domain, path) in engines:
-        engine_key = u'{}{}'.format(domain, path)
-    elif u'{}{}'.format(lossy_domain, path) in engines:
-        engine_key = u'{}{}'.format(lossy_domain, path)
-    elif lossy_domain in engines:
-        engine_key = lossy_domain
-    elif domain not in engines:
-        if query[:14] == 'cx=partner-pub':
-            # Google custom search engine
-            engine_key = 'google.com/cse'
-        elif url_parts.path[:28] == '/pemonitorhosted/ws/results/':
-            # private-label search powered by InfoSpace Metasearch
-            engine_key = 'wsdsold.infospace.com'
-        elif '.images.search.yahoo.com' in url_parts.netloc:
-            # Yahoo! Images
-            engine_key = 'images.search.yahoo.com'
-        elif '.search.yahoo.com' in url_parts.netloc:
-            # Yahoo!
-            engine_key = 'search.yahoo.com'
-        else:
-            return None
+    tier, engine_key = _lookup(engines, url_parts, adaptive)
+    if engine_key is None and _profile_fallback:
+        tier, engine_key = _fallback_lookup(url_parts)
+        engines = _full_engines
+    _count_lookup(tier, engine_key)
+    if engine_key is None:
+        return None
 
     return engines.get(engine_key)
 
@@ -549,9 +1693,34 @@ def is_serp(referring_url, parser=None, use_naive_method=False):
 
     :returns: ``True`` if SERP, ``False`` otherwise.
     """
-    res = extract(referring_url, parser=parser,
-                  use_naive_method=use_naive_method)
-    return res is not None
+    url_parts = _unicode_urlparse(referring_url)
+    if url_parts is None:
+        return False
+
+    if parser is None:
+        parser = get_parser(url_parts)
+
+    if parser is None:
+        return use_naive_method and _naive_is_serp(url_parts)
+
+    return parser.is_serp(url_parts)
+
+
+def is_serp_batch(referring_urls, parser=None, use_naive_method=False):
+    """
+    Determine which of a batch of referring URLs are SERPs, resolving a
+    parser once per distinct host and path.  See :func:`is_serp` for
+    arguments.
+
+    :param referring_urls: Suspected SERP URLs.
+    :type referring_urls:  iterable of ``str`` or
+                           :class:`urlparse.ParseResult`
+
+    :returns: a ``list`` of ``True`` or ``False`` in the same order as
+              ``referring_urls``.
+    """
+    plan = BatchPlan(referring_urls)
+    return plan.is_serp(parser=parser, use_naive_method=use_naive_method)
 
 
 def extract(serp_url, parser=None, lower_case=True, trimmed=True,
@@ -601,24 +1770,64 @@ def extract(serp_url, parser=None, lower_case=True, trimmed=True,
         if not use_naive_method:
             return None  # Tried to get keyword from non SERP URL
 
-        # Try to use naive method of detection
-        if _naive_re.search(url_parts.netloc):
-            query = _unicode_parse_qs(url_parts.query, keep_blank_values=True)
-            for param in _naive_params:
-                if param in query:
-                    import tldextract
-                    tld_res = tldextract.extract(url_parts.netloc)
-                    return ExtractResult(tld_res.domain,
-                                         query[param][0],
-                                         None)
-
-        return None  # Naive method could not detect a keyword either
+        return _naive_extract(url_parts)
 
     result = parser.parse(url_parts)
 
     if result is None:
         return None
 
+    return _normalize_result(result, lower_case, trimmed, collapse_whitespace)
+
+
+def _naive_extract(url_parts):
+    """
+    Try to extract a keyword from a URL that no parser exists for, see
+    ``use_naive_method`` in :func:`extract`.
+
+    :param url_parts: A URL.
+    :type url_parts:  :class:`urlparse.ParseResult` with all elements as
+                      unicode
+
+    :returns: an :class:`ExtractResult` instance without a parser if a
+              keyword was found, ``None`` otherwise
+    """
+    if _naive_re.search(url_parts.netloc):
+        query = _unicode_parse_qs(url_parts.query, keep_blank_values=True)
+        for param in _naive_params:
+            if param in query:
+                import tldextract
+                tld_res = tldextract.extract(url_parts.netloc)
+                return ExtractResult(tld_res.domain,
+                                     query[param][0],
+                                     None)
+
+    return None  # Naive method could not detect a keyword either
+
+
+def _naive_is_serp(url_parts):
+    """
+    Whether :func:`_naive_extract` would find a keyword in ``url_parts``.
+    """
+    if _naive_re.search(url_parts.netloc):
+        keys = _query_keys(url_parts.query)
+        for param in _naive_params:
+            if param in keys:
+                return True
+
+    return False
+
+
+def _normalize_result(result, lower_case, trimmed, collapse_whitespace):
+    """
+    Normalize the keyword of ``result`` in place, see :func:`extract`.
+
+    :returns: ``result``
+    """
+    max_length = _limits['max_keyword_length']
+    if max_length is not None and len(result.keyword) > max_length:
+        _reject('max_keyword_length')
+        result.keyword = result.keyword[:max_length]
     if lower_case:
         result.keyword = result.keyword.lower()
     if trimmed:
@@ -629,8 +1838,317 @@ def extract(serp_url, parser=None, lower_case=True, trimmed=True,
     return result
 
 
+# Tiers of match rules that only depend on the host and path of a URL, see
+# BatchPlan
+_host_path_tiers = frozenset(('domain+path', 'lossy_domain+path',
+                              'lossy_domain', 'domain'))
+
+
+class BatchPlan(object):
+    """Plans extraction for a batch of referrers.
+
+    Referrers are grouped by ``(netloc, path)`` so that the parser lookup
+    (and :func:`_get_lossy_domain`) runs once per group rather than once per
+    referrer, leaving only keyword extraction to be done per URL.  Results
+    are always returned in input order.
+
+    Use :func:`extract_batch` unless you want to inspect the plan, e.g.::
+
+        plan = BatchPlan(urls)
+        results = plan.extract()
+        print plan.dedupe_ratio
+    """
+    __slots__ = ('url_parts', 'groups')
+
+    def __init__(self, serp_urls):
+        """New instance of a :class:`BatchPlan`.
+
+        :param serp_urls: Suspected SERP URLs.
+        :type serp_urls:  iterable of ``str`` or
+                          :class:`urlparse.ParseResult`
+        """
+        self.url_parts = [_unicode_urlparse(url) for url in serp_urls]
+        self.groups = {}
+        for i, url_parts in enumerate(self.url_parts):
+            if url_parts is None:
+                continue
+            group = (url_parts.netloc, url_parts.path)
+            if group in self.groups:
+                self.groups[group].append(i)
+            else:
+                self.groups[group] = [i]
+
+    def __len__(self):
+        return len(self.url_parts)
+
+    @property
+    def dedupe_ratio(self):
+        """Number of referrers per parser lookup (``1.0`` means no two
+        referrers shared a host and path)."""
+        if not self.groups:
+            return 1.0
+        planned = sum(len(indices) for indices in self.groups.itervalues())
+        return float(planned) / len(self.groups)
+
+    def get_parsers(self):
+        """
+        Find a parser for every referrer in the batch, see
+        :func:`get_parser`.
+
+        :returns: a ``list`` of :class:`SearchEngineParser` objects (or
+                  ``None``) in input order.
+        """
+        engines = _get_search_engines()
+        parsers = [None] * len(self.url_parts)
+        for indices in self.groups.itervalues():
+            first = self.url_parts[indices[0]]
+            # Resolve the group without its query string; only the rules
+            # below the host/path tiers (i.e. query prefix rules) need to
+            # look at each referrer's query string
+            tier, engine_key = _lookup(engines, first._replace(query=u'',
+                                                               fragment=u''))
+            parser = engines.get(engine_key) if engine_key else None
+            if tier in _host_path_tiers:
+                _count_lookup(tier, engine_key, len(indices))
+                for i in indices:
+                    parsers[i] = parser
+                continue
+
+            index = _get_wildcard_index()
+            for i in indices:
+                url_parts = self.url_parts[i]
+                query_key = index.match_query(_serp_query_string(url_parts))
+                if query_key is not None:
+                    _count_lookup('query_prefix', query_key)
+                    parsers[i] = engines.get(query_key)
+                elif engine_key is None and _profile_fallback:
+                    fallback_tier, fallback_key = _fallback_lookup(url_parts)
+                    _count_lookup(fallback_tier, fallback_key)
+                    if fallback_key is not None:
+                        parsers[i] = _full_engines.get(fallback_key)
+                else:
+                    _count_lookup(tier, engine_key)
+                    parsers[i] = parser
+        return parsers
+
+    def is_serp(self, parser=None, use_naive_method=False):
+        """
+        Determine which referrers in the batch are SERPs, see
+        :func:`is_serp` for arguments.
+
+        :returns: a ``list`` of ``True`` or ``False`` in input order.
+        """
+        if parser is None:
+            parsers = self.get_parsers()
+        else:
+            parsers = [parser] * len(self.url_parts)
+
+        results = []
+        for url_parts, parser in zip(self.url_parts, parsers):
+            if parser is not None:
+                results.append(parser.is_serp(url_parts))
+            else:
+                results.append(use_naive_method and url_parts is not None and
+                               _naive_is_serp(url_parts))
+        return results
+
+    def extract(self, parser=None, lower_case=True, trimmed=True,
+                collapse_whitespace=True, use_naive_method=False):
+        """
+        Extract a keyword from every referrer in the batch, see
+        :func:`extract` for arguments.
+
+        :returns: a ``list`` of :class:`ExtractResult` instances (or
+                  ``None``) in input order.
+        """
+        if parser is None:
+            parsers = self.get_parsers()
+        else:
+            parsers = [parser] * len(self.url_parts)
+
+        results = []
+        for url_parts, parser in zip(self.url_parts, parsers):
+            result = None
+            if parser is not None:
+                result = parser.parse(url_parts)
+                if result is not None:
+                    result = _normalize_result(result, lower_case, trimmed,
+                                               collapse_whitespace)
+            elif use_naive_method and url_parts is not None:
+                result = _naive_extract(url_parts)
+            results.append(result)
+        return results
+
+
+def extract_batch(serp_urls, parser=None, lower_case=True, trimmed=True,
+                  collapse_whitespace=True, use_naive_method=False):
+    """
+    Extract keywords from a batch of suspected SERP URLs, resolving a parser
+    once per distinct host and path.  See :class:`BatchPlan` and
+    :func:`extract` for arguments.
+
+    :param serp_urls: Suspected SERP URLs.
+    :type serp_urls:  iterable of ``str`` or :class:`urlparse.ParseResult`
+
+    :returns: a ``list`` of :class:`ExtractResult` instances (or ``None``) in
+              the same order as ``serp_urls``.
+    """
+    plan = BatchPlan(serp_urls)
+    return plan.extract(parser=parser, lower_case=lower_case, trimmed=trimmed,
+                        collapse_whitespace=collapse_whitespace,
+                        use_naive_method=use_naive_method)
+
+
+# Templates of link macros, see _get_link_template
+_link_templates = {}
+_link_placeholder = u'\x00'
+
+
+def _get_link_template(link_macro):
+    """
+    Split ``link_macro`` around its keyword placeholder once so that links
+    can be built by concatenation rather than ``str.format``.
+
+    :returns: a ``(parts, quote_keyword, absolute)`` tuple where ``parts``
+              are to be joined with the percent-encoded keyword,
+              ``quote_keyword`` does the encoding (spaces become ``+`` in
+              query strings) and ``absolute`` is whether the macro is a full
+              URL rather than relative to the engine's base URL.
+    """
+    try:
+        return _link_templates[link_macro]
+    except KeyError:
+        pass
+    link = link_macro.format(k=_link_placeholder)
+    parts = tuple(link.split(_link_placeholder))
+    in_query = u'?' in parts[0]
+    quote_keyword = quote_plus if in_query else quote
+    absolute = link.startswith((u'http://', u'https://'))
+    if not absolute:
+        parts = (parts[0].lstrip(u'/'),) + parts[1:]
+    template = (parts, quote_keyword, absolute)
+    _link_templates[link_macro] = template
+    return template
+
+
+def _encode_keyword(keyword, charset, quote_keyword):
+    """Percent-encode ``keyword`` in ``charset``, or UTF-8 if it can't be
+    encoded in ``charset``."""
+    if isinstance(keyword, unicode):
+        try:
+            keyword = keyword.encode(charset)
+        except (UnicodeEncodeError, LookupError):
+            keyword = keyword.encode('utf-8')
+    return quote_keyword(keyword, safe='')
+
+
+def get_serp_urls(parsers, base_urls, keywords):
+    """
+    Build links to SERPs for columns of parsers, base URLs and keywords,
+    e.g. to link every result of :func:`extract_batch` back to its engine.
+    Like :meth:`SearchEngineParser.get_serp_url`, but keywords are
+    percent-encoded in the engine's charset (or UTF-8 when they can't be),
+    each ``link_macro`` is only parsed once and repeated rows are only built
+    once.
+
+    :param parsers:   Parsers, or their :attr:`SearchEngineParser.engine_id`.
+    :type parsers:    iterable of :class:`SearchEngineParser` or ``unicode``
+
+    :param base_urls: Strings of format ``'<scheme>://<netloc>'``.
+    :type base_urls:  iterable of ``str``
+
+    :param keywords:  Search engine keywords.
+    :type keywords:   iterable of ``unicode``
+
+    :returns: a ``list`` of links in input order, ``None`` for rows without a
+              parser or keyword, or whose parser has no ``link_macro``.
+    """
+    links = {}
+    encoded = {}
+    output = []
+    for row in izip(parsers, base_urls, keywords):
+        try:
+            output.append(links[row])
+            continue
+        except KeyError:
+            pass
+
+        parser, base_url, keyword = row
+        if isinstance(parser, basestring):
+            parser = _get_parser_by_id(parser)
+        link = None
+        if parser is not None and parser.link_macro is not None and \
+                keyword is not None:
+            parts, quote_keyword, absolute = \
+                _get_link_template(parser.link_macro)
+            charset = parser.charsets[0] if parser.charsets else 'utf-8'
+            encoding = (keyword, charset, quote_keyword)
+            try:
+                quoted = encoded[encoding]
+            except KeyError:
+                quoted = _encode_keyword(*encoding)
+                encoded[encoding] = quoted
+            link = quoted.join(parts)
+            if not absolute:
+                link = base_url.rstrip('/') + u'/' + link
+        links[row] = link
+        output.append(link)
+    return output
+
+
+def _open_inputs(filenames):
+    """
+    Yield an open file for each of ``filenames`` in turn, where ``'-'`` is
+    stdin.
+    """
+    import sys
+    for filename in filenames:
+        if filename == '-':
+            yield sys.stdin
+            continue
+        with open(filename, 'rb') as f:
+            yield f
+
+
+def _follow(args, adapter, cache, format_result, out):
+    """
+    Run ``serpextract --follow`` until interrupted, printing to ``out``
+    which must accept ``unicode``.
+    """
+    import sys
+    from collections import Counter
+    from . import logs
+
+    follower = logs.LogFollower(args.input, args.checkpoint, args.from_start)
+    try:
+        for results, stats in logs.follow_referrers(
+                follower, adapter, args.interval, min(args.interval, 1.0),
+                args.batch_size, cache):
+            if args.counts:
+                counts = Counter((res.engine_name, res.keyword)
+                                 for _, res in results)
+                for (engine_name, keyword), count in counts.most_common():
+                    res = ExtractResult(engine_name, keyword, None)
+                    print >> out, u'{},{}'.format(count, format_result(res))
+            else:
+                for _, res in results:
+                    print >> out, format_result(res)
+            out.flush()
+            follower.commit()
+            print >> sys.stderr, '{lines} lines, {serps} SERPs, ' \
+                '{lines_per_second:.0f} lines/s, lag {lag_bytes} bytes ' \
+                '{lag_seconds:.1f}s'.format(**stats)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        follower.close()
+        if cache is not None:
+            cache.close()
+
+
 def main():
     import argparse
+    import codecs
     import sys
     import re
 
@@ -638,35 +2156,155 @@ def main():
         description='Parse a SERP URL to extract engine name and keyword.')
 
     parser.add_argument('input', metavar='url', type=unicode, nargs='*',
-                        help='A potential SERP URL')
+                        help='A potential SERP URL, or a log file when '
+                             '--log-format is given (default stdin)')
     parser.add_argument('-l', '--list', default=False, action='store_true',
                         help='Print a list of all the SearchEngineParsers.')
+    parser.add_argument('-f', '--log-format', default=None,
+                        choices=('combined', 'tsv', 'csv', 'jsonl'),
+                        help='Read referrers from log files and only print '
+                             'SERPs.')
+    parser.add_argument('--field', default=None,
+                        help='Referrer column index or header name for tsv '
+                             'and csv logs, or key for jsonl logs (default '
+                             '"referrer").')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='Number of log lines to extract at a time.')
+    parser.add_argument('--cache', default=None, metavar='FILE',
+                        help='Cache results of log extraction in an SQLite '
+                             'database so re-runs over the same logs are '
+                             'faster.')
+    parser.add_argument('--profile', default=None, metavar='FILE',
+                        help='Load an engine profile in place of the full '
+                             'list of engines.  With --list, print how many '
+                             'lookups each rule resolved when it was '
+                             'recorded.')
+    parser.add_argument('--fallback', default=False, action='store_true',
+                        help='Look up referrers that no rule in --profile '
+                             'matches in the full list of engines.')
+    parser.add_argument('--record-profile', default=None, metavar='FILE',
+                        help='Save the rules that matched the input as an '
+                             'engine profile (referrers served from --cache '
+                             'are not counted).')
+    parser.add_argument('--follow', default=False, action='store_true',
+                        help='Keep following log files as they grow (and '
+                             'are rotated), printing SERPs and metrics every '
+                             '--interval.')
+    parser.add_argument('--interval', type=float, default=None,
+                        metavar='SECONDS',
+                        help='Seconds between outputs in --follow mode '
+                             '(default 10).')
+    parser.add_argument('--counts', default=False, action='store_true',
+                        help='In --follow mode, print the number of times '
+                             'each engine and keyword was seen per interval '
+                             'rather than every SERP.')
+    parser.add_argument('--checkpoint', default=None, metavar='FILE',
+                        help='Save how far each log file has been followed '
+                             'so --follow carries on from there when '
+                             'restarted.')
+    parser.add_argument('--from-start', default=False, action='store_true',
+                        help='Follow log files that aren\'t in --checkpoint '
+                             'from their start rather than only new lines.')
 
     args = parser.parse_args()
 
+    follow_options = [name for name, value in (
+        ('--follow', args.follow), ('--interval', args.interval is not None),
+        ('--counts', args.counts), ('--checkpoint', args.checkpoint),
+        ('--from-start', args.from_start)) if value]
+    if follow_options and not args.log_format:
+        parser.error('{} needs --log-format'.format(follow_options[0]))
+    if follow_options and not args.follow:
+        parser.error('{} needs --follow'.format(follow_options[0]))
+    if args.interval is None:
+        args.interval = 10.0
+    elif args.interval <= 0:
+        parser.error('--interval must be positive')
+
+    rule_hits = None
+    if args.profile:
+        try:
+            rule_hits = load_engine_profile(args.profile, args.fallback)
+        except (IOError, ValueError) as e:
+            parser.error(str(e))
+
     if args.list:
         engines = _get_search_engines()
         engines = sorted(engines.iteritems(), key=lambda x: x[1].engine_name)
-        print '{:<30}{}'.format('Fuzzy Domain', 'Parser')
+        if rule_hits is None:
+            print '{:<30}{}'.format('Fuzzy Domain', 'Parser')
+            for fuzzy_domain, parser in engines:
+                print '{:<30}{}'.format(fuzzy_domain, parser)
+            print '{} parsers.'.format(len(engines))
+            sys.exit(0)
+
+        total = sum(rule_hits.itervalues()) or 1
+        print '{:<30}{:>10}{:>9}  {}'.format('Fuzzy Domain', 'Hits',
+                                             'Coverage', 'Parser')
         for fuzzy_domain, parser in engines:
-            print '{:<30}{}'.format(fuzzy_domain, parser)
-        print '{} parsers.'.format(len(engines))
+            hits = rule_hits.get(fuzzy_domain, 0)
+            print '{:<30}{:>10}{:>8.2%}  {}'.format(fuzzy_domain, hits,
+                                                   float(hits) / total,
+                                                   parser)
+        print '{} parsers covering {} lookups, {} rules in the full ' \
+              'list.'.format(len(engines), sum(rule_hits.itervalues()),
+                             len(_get_piwik_engines()))
         sys.exit(0)
 
-    if len(args.input) == 0:
-        parser.print_usage()
-        sys.exit(1)
-
     escape_quotes = lambda s: re.sub(r'"', '\\"', s)
 
-    for url in args.input:
-        res = extract(url)
+    def format_result(res):
         if res is None:
             res = ['""', '""']
         else:
             res = [escape_quotes(res.engine_name), escape_quotes(res.keyword)]
             res = [u'"{}"'.format(r) for r in res]
-        print u','.join(res)
+        return u','.join(res)
+
+    if args.log_format:
+        from . import logs
+        try:
+            adapter = logs.get_adapter(args.log_format, args.field)
+        except ValueError as e:
+            parser.error(str(e))
+        cache = None
+        if args.cache:
+            from .cache import ResultCache
+            cache = ResultCache(args.cache)
+        # Keywords aren't ASCII, and stdout has no encoding when piped
+        out = codecs.getwriter('utf-8')(sys.stdout)
+        if args.follow:
+            if not args.input or '-' in args.input:
+                parser.error('--follow needs log files to follow')
+            if args.log_format in ('tsv', 'csv') and \
+                    not (args.field or '').isdigit():
+                parser.error('--follow needs a column index as --field for '
+                             '{} logs'.format(args.log_format))
+            _follow(args, adapter, cache, format_result, out)
+            sys.exit(0)
+        for f in _open_inputs(args.input or ['-']):
+            try:
+                referrers = adapter(f)
+            except ValueError as e:
+                parser.error(str(e))
+            for _, res in logs.extract_referrers(referrers, args.batch_size,
+                                                 cache):
+                if res is not None:
+                    print >> out, format_result(res)
+        if cache is not None:
+            cache.close()
+        if args.record_profile:
+            save_engine_profile(args.record_profile)
+        sys.exit(0)
+
+    if len(args.input) == 0:
+        parser.print_usage()
+        sys.exit(1)
+
+    for url in args.input:
+        print format_result(extract(url))
+    if args.record_profile:
+        save_engine_profile(args.record_profile)
 
 if __name__ == '__main__':
     main()
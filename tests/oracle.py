@@ -0,0 +1,683 @@
+"""A frozen copy of the original ``serpextract`` lookup and parsing logic
+which is used as a reference oracle for differential testing.
+
+Nothing in here should ever be optimized or otherwise changed; it exists so
+that every faster/batched/cached entry point in :mod:`serpextract` can be
+checked against the behaviour it replaced.  See :func:`compare`.
+"""
+import os
+import re
+import logging
+import sys
+import random
+import shutil
+import tempfile
+import time
+from itertools import groupby
+from multiprocessing import Pool
+from urlparse import urlparse, parse_qs, ParseResult
+
+from iso3166 import countries
+import pylru
+
+try:
+    import serpextract.serpextract as serpextract
+except ImportError:
+    import os, sys
+    basedir = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+    sys.path.append(basedir)
+    import serpextract.serpextract as serpextract
+from serpextract.cache import ResultCache, SharedResultCache
+from serpextract.pipeline import imap_extract
+
+
+_country_codes = [country.alpha2.lower()
+                  for country in countries]
+_country_codes += ['uk']
+
+log = logging.getLogger('serpextract')
+
+_domain_cache = pylru.lrucache(500)
+
+_naive_re = re.compile(r'\.?search\.')
+_naive_params = ('q', 'query', 'k', 'keyword', 'term',)
+
+
+# --- Frozen reference implementation ----------------------------------------
+
+def _unicode_parse_qs(qs, **kwargs):
+    if isinstance(qs, str):
+        return parse_qs(qs, **kwargs)
+
+    qs = qs.encode('utf-8', 'ignore')
+    query = parse_qs(qs, **kwargs)
+    unicode_query = {}
+    for key in query:
+        uni_key = key.decode('utf-8', 'ignore')
+        if uni_key == '':
+            continue
+        unicode_query[uni_key] = [p.decode('utf-8', 'ignore') for p in query[key]]
+    return unicode_query
+
+
+def _unicode_urlparse(url, encoding='utf-8', errors='ignore'):
+    if isinstance(url, str):
+        url = url.decode(encoding, errors)
+    elif isinstance(url, ParseResult):
+        parts = list(url)
+        for i in range(len(parts)):
+            if isinstance(parts[i], str):
+                parts[i] = parts[i].decode(encoding, errors)
+        return ParseResult(*parts)
+
+    try:
+        return urlparse(url)
+    except ValueError:
+        msg = u'Malformed URL "{}" could not parse'.format(url)
+        log.debug(msg, exc_info=True)
+        return None
+
+
+def _serp_query_string(parse_result):
+    query = parse_result.query
+    if parse_result.fragment != '':
+        query = u'{}&{}'.format(query, parse_result.fragment)
+
+    return query
+
+
+def _is_url_without_path_query_or_fragment(url_parts):
+    return url_parts.path.strip('/') == '' and url_parts.query == '' \
+           and url_parts.fragment == ''
+
+
+_engines = None
+def _get_search_engines():
+    global _engines
+    if _engines:
+        return _engines
+
+    piwik_engines = serpextract._get_piwik_engines()
+    get_engine_name = lambda x: x[1][0]
+    definitions_by_engine = groupby(piwik_engines.iteritems(), get_engine_name)
+    _engines = {}
+
+    for engine_name, rule_group in definitions_by_engine:
+        defaults = {
+            'extractor': None,
+            'link_macro': None,
+            'charsets': ['utf-8']
+        }
+
+        for i, rule in enumerate(rule_group):
+            domain = rule[0]
+            rule = rule[1][1:]
+            if i == 0:
+                defaults['extractor'] = rule[0]
+                if len(rule) >= 2:
+                    defaults['link_macro'] = rule[1]
+                if len(rule) >= 3:
+                    defaults['charsets'] = rule[2]
+
+                _engines[domain] = SearchEngineParser(engine_name,
+                                                      defaults['extractor'],
+                                                      defaults['link_macro'],
+                                                      defaults['charsets'])
+                continue
+
+            args = [engine_name, defaults['extractor'],
+                    defaults['link_macro'], defaults['charsets']]
+            if len(rule) >= 1:
+                args[1] = rule[0]
+
+            if len(rule) >= 2:
+                args[2] = rule[1]
+
+            if len(rule) == 3:
+                args[3] = rule[2]
+
+            _engines[domain] = SearchEngineParser(*args)
+
+    return _engines
+
+
+_get_lossy_domain_regex = None
+def _get_lossy_domain(domain):
+    global _domain_cache, _get_lossy_domain_regex
+
+    if domain in _domain_cache:
+        return _domain_cache[domain]
+
+    if not _get_lossy_domain_regex:
+        codes = '|'.join(_country_codes)
+        _get_lossy_domain_regex = re.compile(
+                r'^'
+                r'(?:w+\d*\.|search\.|m\.)*' +
+                r'((?P<ccsub>{})\.)?'.format(codes) +
+                r'(?P<domain>.*?)' +
+                r'(?P<tld>\.(com|org|net|co|edu))?' +
+                r'(?P<tldcc>\.({}))?'.format(codes) +
+                r'$')
+
+    res = _get_lossy_domain_regex.match(domain).groupdict()
+    output = u'%s%s%s' % ('{}.' if res['ccsub'] else '',
+                          res['domain'],
+                          '.{}' if res['tldcc'] else res['tld'] or '')
+    _domain_cache[domain] = output
+    return output
+
+
+class ExtractResult(object):
+    __slots__ = ('engine_name', 'keyword', 'parser')
+
+    def __init__(self, engine_name, keyword, parser):
+        self.engine_name = engine_name
+        self.keyword = keyword
+        self.parser = parser
+
+
+class SearchEngineParser(object):
+    __slots__ = ('engine_name', 'keyword_extractor', 'link_macro', 'charsets')
+
+    def __init__(self, engine_name, keyword_extractor, link_macro, charsets):
+        self.engine_name = engine_name
+        if isinstance(keyword_extractor, basestring):
+            keyword_extractor = [keyword_extractor]
+        self.keyword_extractor = keyword_extractor[:]
+        for i, extractor in enumerate(self.keyword_extractor):
+            if extractor.startswith('/'):
+                extractor = extractor.strip('/')
+                extractor = re.compile(extractor)
+                self.keyword_extractor[i] = extractor
+
+        self.link_macro = link_macro
+        if isinstance(charsets, basestring):
+            charsets = [charsets]
+        self.charsets = [c.lower() for c in charsets]
+
+    def get_serp_url(self, base_url, keyword):
+        if self.link_macro is None:
+            return None
+
+        link = u'{}/{}'.format(base_url, self.link_macro.format(k=keyword))
+        return link
+
+    def parse(self, url_parts):
+        original_query = _serp_query_string(url_parts)
+        query = _unicode_parse_qs(original_query, keep_blank_values=True)
+
+        keyword = None
+        engine_name = self.engine_name
+
+        if engine_name == 'Google Images' or \
+           (engine_name == 'Google' and '/imgres' in original_query):
+            engine_name = 'Google Images'
+            if 'prev' in query:
+                prev_query = _unicode_parse_qs(urlparse(query['prev'][0]).query)
+                keyword = prev_query.get('q', [None])[0]
+        elif engine_name == 'Google' and 'as_' in original_query:
+            keys = []
+            key = query.get('as_q')
+            if key:
+              keys.append(key[0])
+            key = query.get('as_oq')
+            if key:
+              key = key[0].replace('+', ' OR ')
+              keys.append(key)
+            key = query.get('as_epq')
+            if key:
+              keys.append(u'"{}"'.format(key[0]))
+            key = query.get('as_eq')
+            if key:
+              keys.append(u'-{}'.format(key[0]))
+
+            keyword = u' '.join(keys).strip()
+
+        if engine_name == 'Google':
+            tbm = query.get('tbm', [None])[0]
+            if tbm == 'isch':
+                engine_name = 'Google Images'
+            elif tbm == 'vid':
+                engine_name = 'Google Video'
+            elif tbm == 'shop':
+                engine_name = 'Google Shopping'
+
+        if keyword is not None:
+            return ExtractResult(engine_name, keyword, self)
+
+        for extractor in self.keyword_extractor:
+            if not isinstance(extractor, basestring):
+                match = extractor.search(url_parts.path)
+                if match:
+                    keyword = match.group(1)
+                    break
+            else:
+                if extractor in query:
+                    keyword = query[extractor][-1]
+
+                if keyword is None and extractor == 'q' and \
+                   engine_name in ('Google Images', 'DuckDuckGo'):
+                    keyword = ''
+                elif keyword is None and extractor == 'q' and \
+                     engine_name == 'Google' and \
+                     _is_url_without_path_query_or_fragment(url_parts):
+                    keyword = ''
+
+        if keyword is not None:
+            return ExtractResult(engine_name, keyword, self)
+
+
+def get_parser(referring_url):
+    engines = _get_search_engines()
+    url_parts = _unicode_urlparse(referring_url)
+    if url_parts is None:
+        return None
+
+    query = _serp_query_string(url_parts)
+
+    domain = url_parts.netloc
+    path = url_parts.path
+    lossy_domain = _get_lossy_domain(url_parts.netloc)
+    engine_key = url_parts.netloc
+
+    if u'{}{}'.format(domain, path) in engines:
+        engine_key = u'{}{}'.format(domain, path)
+    elif u'{}{}'.format(lossy_domain, path) in engines:
+        engine_key = u'{}{}'.format(lossy_domain, path)
+    elif lossy_domain in engines:
+        engine_key = lossy_domain
+    elif domain not in engines:
+        if query[:14] == 'cx=partner-pub':
+            engine_key = 'google.com/cse'
+        elif url_parts.path[:28] == '/pemonitorhosted/ws/results/':
+            engine_key = 'wsdsold.infospace.com'
+        elif '.images.search.yahoo.com' in url_parts.netloc:
+            engine_key = 'images.search.yahoo.com'
+        elif '.search.yahoo.com' in url_parts.netloc:
+            engine_key = 'search.yahoo.com'
+        else:
+            return None
+
+    return engines.get(engine_key)
+
+
+def is_serp(referring_url, parser=None, use_naive_method=False):
+    res = extract(referring_url, parser=parser,
+                  use_naive_method=use_naive_method)
+    return res is not None
+
+
+def extract(serp_url, parser=None, lower_case=True, trimmed=True,
+            collapse_whitespace=True, use_naive_method=False):
+    url_parts = _unicode_urlparse(serp_url)
+    if url_parts is None:
+        return None
+
+    result = None
+    if parser is None:
+        parser = get_parser(url_parts)
+
+    if parser is None:
+        if not use_naive_method:
+            return None
+
+        if _naive_re.search(url_parts.netloc):
+            query = _unicode_parse_qs(url_parts.query, keep_blank_values=True)
+            for param in _naive_params:
+                if param in query:
+                    import tldextract
+                    tld_res = tldextract.extract(url_parts.netloc)
+                    return ExtractResult(tld_res.domain,
+                                         query[param][0],
+                                         None)
+
+        return None
+
+    result = parser.parse(url_parts)
+
+    if result is None:
+        return None
+
+    if lower_case:
+        result.keyword = result.keyword.lower()
+    if trimmed:
+        result.keyword = result.keyword.strip()
+    if collapse_whitespace:
+        result.keyword = re.sub(r'\s+', ' ', result.keyword, re.UNICODE)
+
+    return result
+
+
+# --- Referrer corpus ---------------------------------------------------------
+
+_schemes = ('http://', 'https://', 'HTTP://', '//', '')
+_prefixes = ('', '', 'www.', 'www2.', 'm.', 'search.', 'ca.', 'uk.', 'de.')
+_paths = ('', '/', '/search', '/s', '/url', '/web', '/imgres', '/cse',
+          '/images/search', '/search;_ylt=A0oG7l7PeB5P3G0AKASl87UF',
+          '/s/ars+technica/', '/pemonitorhosted/ws/results/Web/q/1/',
+          '/yandsearch', '/search/dir')
+_params = ('q', 'p', 'query', 'text', 'wd', 'k', 'keyword', 'term', 'as_q',
+           'as_oq', 'as_epq', 'as_eq', 'tbm', 'prev', 'cx', 'sa', 'hl', 'ei')
+_values = (u'hello', u'united+states', u'%22justin+timberlake%22',
+           u'%E0%A4%A8%E0%A4%AE', u'%D0%BF%D1%80', u'%E4%BD%A0%E5%A5%BD',
+           u'', u'++spaced++out++', u'UPPER%20Case', u'isch', u'vid',
+           u'shop', u'partner-pub-1234', u'/search%3Fq%3Dimages%26tbm%3Disch',
+           u'%', u'%zz', u'%E0%A4', u'%C2', u'caf\xe9', u'a%26b%3Dc')
+_extra_hosts = (u'www.yahoo.com', u'news.google.com', u'plus.url.google.com',
+                u'ca.search.yahoo.com', u'ca.images.search.yahoo.com',
+                u'search.piccshare.com', u'www.reddit.com', u'[::1',
+                u'a]', u'www.google.com:8080', u'user@www.bing.com', u'',
+                u'localhost', u'xn--bcher-kva.example', u'WWW.GOOGLE.COM')
+
+
+def _engine_hosts(rng):
+    """Expand every match rule in ``search_engines.pickle`` into a host (and
+    sometimes a path) with a random country code filled in, paired with the
+    query string params its parser extracts keywords from."""
+    engines = _get_search_engines()
+    hosts = []
+    for key in serpextract._get_piwik_engines():
+        host = key.replace(u'{}', rng.choice(_country_codes))
+        params = [e for e in engines[key].keyword_extractor
+                  if isinstance(e, basestring)]
+        hosts.append((host, params))
+    return hosts
+
+
+def _random_query(rng, params=()):
+    pairs = []
+    for _ in range(rng.randint(0, 5)):
+        pairs.append(u'{}={}'.format(rng.choice(_params), rng.choice(_values)))
+    if params and rng.random() < 0.7:
+        pairs.insert(rng.randint(0, len(pairs)),
+                     u'{}={}'.format(rng.choice(params), rng.choice(_values)))
+    if rng.random() < 0.1:
+        pairs.append(rng.choice(_params))  # A param with no '='
+    if rng.random() < 0.05:
+        pairs.insert(0, u'cx=partner-pub-1234')
+    return rng.choice((u'&', u'&', u';')).join(pairs)
+
+
+def generate_referrers(count, seed=0):
+    """
+    Generate a reproducible list of ``count`` suspected SERP referrers built
+    from every engine domain in ``search_engines.pickle`` (with country-code
+    variants), a few known edge-case hosts and random paths, queries and
+    fragments including malformed percent-encoding.
+
+    :param count: Number of referrers to generate.
+    :type count:  ``int``
+
+    :param seed:  Seed for the random number generator.
+    :type seed:   ``int``
+
+    :returns: a ``list`` of ``str`` and ``unicode`` referrers.
+    """
+    rng = random.Random(seed)
+    hosts = _engine_hosts(rng)
+    urls = []
+    for i in range(count):
+        if i < len(hosts):
+            # Make sure that every rule gets exercised at least once
+            host = hosts[i]
+        elif rng.random() < 0.1:
+            host = (rng.choice(_extra_hosts), [u'q', u'p'])
+        else:
+            host = rng.choice(hosts)
+        host, params = host
+
+        path = u''
+        if u'/' in host:
+            host, path = host.split(u'/', 1)
+            path = u'/' + path
+        if rng.random() < 0.5:
+            path = rng.choice(_paths)
+        host = rng.choice(_prefixes) + host
+
+        url = rng.choice(_schemes) + host + path
+        if rng.random() < 0.8:
+            url += u'?' + _random_query(rng, params)
+        if rng.random() < 0.2:
+            url += u'#' + _random_query(rng, params)
+
+        if rng.random() < 0.5:
+            url = url.encode('utf-8')
+        urls.append(url)
+
+    return urls
+
+
+# --- Differential comparison -------------------------------------------------
+
+def _parser_key(parser):
+    """A comparable description of a parser which doesn't depend on object
+    identity."""
+    if parser is None:
+        return None
+    extractors = tuple(getattr(e, 'pattern', e)
+                       for e in parser.keyword_extractor)
+    return (parser.engine_name, extractors, parser.link_macro,
+            tuple(parser.charsets))
+
+
+def _result_key(result):
+    if result is None:
+        return None
+    return (result.engine_name, result.keyword, _parser_key(result.parser))
+
+
+def _netloc(url):
+    return urlparse(url).netloc.lower()
+
+
+def _parse(module):
+    def parse(url):
+        parser = module.get_parser(url)
+        if parser is None:
+            return None
+        return parser.parse(module._unicode_urlparse(url))
+    return parse
+
+
+def _with_limits(func, **limits):
+    """Run ``func`` with :func:`serpextract.set_limits` applied."""
+    def limited(url):
+        previous = serpextract.get_limits()
+        serpextract.set_limits(**limits)
+        try:
+            return func(url)
+        finally:
+            serpextract.set_limits(**previous)
+    return limited
+
+
+def _cached(cache_class, **kwargs):
+    """Extract a batch through a fresh ``cache_class`` (see
+    :mod:`serpextract.cache`) twice and return the second pass, which is
+    mostly cache reads."""
+    def cached(urls):
+        tempdir = tempfile.mkdtemp()
+        cache = cache_class(os.path.join(tempdir, 'cache'))
+        try:
+            cache.extract_batch(urls, **kwargs)
+            return cache.extract_batch(urls, **kwargs)
+        finally:
+            cache.close()
+            shutil.rmtree(tempdir)
+    return cached
+
+
+def _pooled(imap, pool_class, **kwargs):
+    """Extract a batch through ``imap`` in a fresh ``pool_class`` (see
+    :mod:`serpextract.pipeline`)."""
+    def pooled(urls):
+        pool = pool_class(2)
+        try:
+            return [res for _, res in imap(urls, pool, chunk_size=97,
+                                           **kwargs)]
+        finally:
+            pool.terminate()
+    return pooled
+
+
+def _profiled(func, recorded=None, fallback=False):
+    """Run a batch through ``func`` with an engine profile (see
+    :func:`serpextract.load_engine_profile`) recorded over the first
+    ``recorded`` referrers of the batch (all of them by default)."""
+    def profiled(urls):
+        before = serpextract.get_rule_stats()
+        serpextract.BatchPlan(urls[:recorded]).get_parsers()
+        rule_hits = dict((rule, hits - before.get(rule, 0))
+                         for rule, hits in serpextract.get_rule_stats().items())
+        tempdir = tempfile.mkdtemp()
+        filename = os.path.join(tempdir, 'profile.json')
+        try:
+            serpextract.save_engine_profile(filename, rule_hits=rule_hits)
+            serpextract.load_engine_profile(filename, fallback=fallback)
+            return func(urls)
+        finally:
+            serpextract.unload_engine_profile()
+            shutil.rmtree(tempdir)
+    return profiled
+
+
+# Limits that no referrer in the corpus should run into
+_generous_limits = dict(max_url_length=65536, max_query_params=1000,
+                        max_keyword_length=1000, validate_host=True)
+
+
+# Each entry point is (name, candidate, reference, normalize) where candidate
+# and reference take a single referrer.  Register new optimized, batched or
+# cached entry points here so they are diffed against the oracle.
+ENTRY_POINTS = [
+    ('get_parser', serpextract.get_parser, get_parser, _parser_key),
+    ('get_parser(adaptive=False)',
+        lambda url: serpextract.get_parser(url, adaptive=False),
+        get_parser, _parser_key),
+    ('_unicode_urlparse', serpextract._unicode_urlparse, _unicode_urlparse,
+        lambda parts: tuple(parts) if parts is not None else None),
+    ('_get_lossy_domain',
+        lambda url: serpextract._get_lossy_domain(_netloc(url)),
+        lambda url: _get_lossy_domain(_netloc(url)), None),
+    ('SearchEngineParser.parse', _parse(serpextract),
+        _parse(sys.modules[__name__]), _result_key),
+    ('extract', serpextract.extract, extract, _result_key),
+    ('extract(use_naive_method)',
+        lambda url: serpextract.extract(url, use_naive_method=True),
+        lambda url: extract(url, use_naive_method=True), _result_key),
+    ('extract(raw keyword)',
+        lambda url: serpextract.extract(url, lower_case=False, trimmed=False,
+                                        collapse_whitespace=False),
+        lambda url: extract(url, lower_case=False, trimmed=False,
+                            collapse_whitespace=False), _result_key),
+    ('extract(limits)', _with_limits(serpextract.extract, **_generous_limits),
+        extract, _result_key),
+    ('is_serp', serpextract.is_serp, is_serp, None),
+    ('is_serp(use_naive_method)',
+        lambda url: serpextract.is_serp(url, use_naive_method=True),
+        lambda url: is_serp(url, use_naive_method=True), None),
+]
+
+
+# Batch entry points are (name, candidate, reference, normalize) where the
+# candidate takes the whole list of referrers and returns a list of results
+# in the same order.
+BATCH_ENTRY_POINTS = [
+    ('extract_batch', serpextract.extract_batch, extract, _result_key),
+    ('extract_batch(use_naive_method)',
+        lambda urls: serpextract.extract_batch(urls, use_naive_method=True),
+        lambda url: extract(url, use_naive_method=True), _result_key),
+    ('is_serp_batch', serpextract.is_serp_batch, is_serp, None),
+    ('is_serp_batch(use_naive_method)',
+        lambda urls: serpextract.is_serp_batch(urls, use_naive_method=True),
+        lambda url: is_serp(url, use_naive_method=True), None),
+    ('BatchPlan.get_parsers',
+        lambda urls: serpextract.BatchPlan(urls).get_parsers(),
+        get_parser, _parser_key),
+    ('ResultCache.extract_batch', _cached(ResultCache), extract,
+        _result_key),
+    ('ResultCache.extract_batch(use_naive_method)',
+        _cached(ResultCache, use_naive_method=True),
+        lambda url: extract(url, use_naive_method=True), _result_key),
+    ('SharedResultCache.extract_batch', _cached(SharedResultCache), extract,
+        _result_key),
+    ('imap_extract(Pool)', _pooled(imap_extract, Pool), extract, _result_key),
+    ('extract_batch(engine profile)', _profiled(serpextract.extract_batch),
+        extract, _result_key),
+    ('get_parser(engine profile)',
+        _profiled(lambda urls: [serpextract.get_parser(url) for url in urls]),
+        get_parser, _parser_key),
+    ('get_parser(profile fallback)',
+        _profiled(lambda urls: [serpextract.get_parser(url) for url in urls],
+                  recorded=0, fallback=True),
+        get_parser, _parser_key),
+]
+
+
+def _outcome(func, url, normalize):
+    try:
+        res = func(url)
+    except Exception as e:
+        return ('raised', type(e).__name__)
+    return normalize(res) if normalize else res
+
+
+def _timed_outcomes(func, urls, normalize):
+    start = time.time()
+    outcomes = [_outcome(func, url, normalize) for url in urls]
+    return outcomes, time.time() - start
+
+
+def _timed_batch_outcomes(func, urls, normalize):
+    start = time.time()
+    try:
+        results = func(urls)
+    except Exception as e:
+        outcomes = [('raised', type(e).__name__)] * len(urls)
+    else:
+        outcomes = [normalize(res) if normalize else res for res in results]
+    return outcomes, time.time() - start
+
+
+def compare(urls, entry_points=None, batch_entry_points=None):
+    """
+    Run every entry point and its reference over ``urls`` and report any
+    differences along with the time taken by each.
+
+    :param urls:         Referrers to check, see :func:`generate_referrers`.
+    :type urls:          ``list``
+
+    :param entry_points: Entry points to check (defaults to
+                         ``ENTRY_POINTS``).
+    :type entry_points:  ``list``
+
+    :param batch_entry_points: Batch entry points to check (defaults to
+                               ``BATCH_ENTRY_POINTS``).
+    :type batch_entry_points:  ``list``
+
+    :returns: a ``list`` of ``dict`` with keys ``name``, ``calls``,
+              ``mismatches`` (a ``list`` of ``(url, expected, actual)``),
+              ``reference_seconds`` and ``candidate_seconds``.
+    """
+    if entry_points is None:
+        entry_points = ENTRY_POINTS
+    if batch_entry_points is None:
+        batch_entry_points = BATCH_ENTRY_POINTS
+
+    runs = [(entry, _timed_outcomes) for entry in entry_points]
+    runs += [(entry, _timed_batch_outcomes) for entry in batch_entry_points]
+
+    reports = []
+    for (name, candidate, reference, normalize), run in runs:
+        expected, ref_secs = _timed_outcomes(reference, urls, normalize)
+        actual, cand_secs = run(candidate, urls, normalize)
+        mismatches = [(url, e, a) for url, e, a in zip(urls, expected, actual)
+                      if e != a]
+        reports.append({
+            'name': name,
+            'calls': len(urls),
+            'mismatches': mismatches,
+            'reference_seconds': ref_secs,
+            'candidate_seconds': cand_secs,
+        })
+    return reports
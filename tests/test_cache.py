@@ -0,0 +1,164 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+try:
+    import serpextract.serpextract as serpextract
+    from serpextract.cache import ResultCache, SharedResultCache
+except ImportError:
+    import os, sys
+    basedir = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+    sys.path.append(basedir)
+    import serpextract.serpextract as serpextract
+    from serpextract.cache import ResultCache, SharedResultCache
+
+
+GOOGLE = 'http://www.google.com/search?q=Hello+World'
+REFERRERS = [GOOGLE, 'http://www.something.com/',
+             'http://search.yahoo.com/search?p=yahoo', GOOGLE]
+
+
+def _keywords(results):
+    return [res.keyword if res else None for res in results]
+
+
+class TestResultCache(unittest.TestCase):
+    """Test the persistent extraction cache."""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, 'cache.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_hits_after_reopen(self):
+        with ResultCache(self.filename) as cache:
+            results = cache.extract_batch(iter(REFERRERS))
+            self.assertEqual(_keywords(results),
+                             [u'hello world', None, u'yahoo', u'hello world'])
+            self.assertEqual(cache.get_stats()['misses'], 3)
+            self.assertEqual(len(cache), 3)
+
+        with ResultCache(self.filename) as cache:
+            results = cache.extract_batch(REFERRERS)
+            self.assertEqual(_keywords(results),
+                             [u'hello world', None, u'yahoo', u'hello world'])
+            self.assertIs(results[0].parser, serpextract.get_parser(GOOGLE))
+            self.assertIsNot(results[0], results[3])
+            stats = cache.get_stats()
+            self.assertEqual((stats['hits'], stats['misses']), (4, 0))
+
+    def test_flags_are_keyed(self):
+        with ResultCache(self.filename) as cache:
+            self.assertEqual(cache.extract(GOOGLE).keyword, u'hello world')
+            self.assertEqual(cache.extract(GOOGLE, lower_case=False).keyword,
+                             u'Hello World')
+            self.assertEqual(cache.get_stats()['misses'], 2)
+            self.assertRaises(TypeError, cache.extract, GOOGLE,
+                              parser=serpextract.get_parser(GOOGLE))
+
+    def test_invalidated_when_engines_change(self):
+        with ResultCache(self.filename) as cache:
+            cache.extract_batch(REFERRERS)
+
+        digest = serpextract._piwik_digest
+        serpextract._piwik_digest = 'changed'
+        serpextract._engines_version = None
+        try:
+            with ResultCache(self.filename) as cache:
+                self.assertEqual(cache.get_stats()['invalidated'], 3)
+                self.assertEqual(len(cache), 0)
+                cache.extract_batch(REFERRERS)
+                self.assertEqual(cache.get_stats()['misses'], 3)
+        finally:
+            serpextract._piwik_digest = digest
+            serpextract._engines_version = None
+
+    def test_compact(self):
+        urls = ['http://www.google.com/search?q={}'.format(i)
+                for i in range(50)]
+        with ResultCache(self.filename, max_entries=20) as cache:
+            results = cache.extract_batch(urls)
+            self.assertEqual(_keywords(results), [str(i) for i in range(50)])
+            self.assertEqual(len(cache), 18)
+            self.assertEqual(cache.get_stats()['compacted'], 32)
+            self.assertEqual(cache.compact(max_entries=10, vacuum=True), 9)
+            self.assertEqual(len(cache), 9)
+
+
+class TestSharedResultCache(unittest.TestCase):
+    """Test the shared memory extraction cache."""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, 'shared.cache')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def test_shared_between_processes(self):
+        with SharedResultCache(self.filename, slots=64) as cache:
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    cache.extract_batch(REFERRERS)
+                finally:
+                    os._exit(0)
+            os.waitpid(pid, 0)
+
+            results = cache.extract_batch(REFERRERS)
+            self.assertEqual(_keywords(results),
+                             [u'hello world', None, u'yahoo', u'hello world'])
+            self.assertIs(results[0].parser, serpextract.get_parser(GOOGLE))
+            self.assertIsNot(results[0], results[3])
+            stats = cache.get_stats()
+            self.assertEqual((stats['hits'], stats['misses']), (4, 0))
+
+            workers = dict((worker['pid'], worker)
+                           for worker in cache.get_worker_stats())
+            self.assertEqual(sorted(workers), sorted([pid, os.getpid()]))
+            self.assertEqual(workers[pid]['misses'], 4)
+            self.assertEqual(workers[pid]['stores'], 3)
+
+            # Any iterable, not just lists
+            self.assertEqual(_keywords(cache.extract_batch(iter(REFERRERS))),
+                             [u'hello world', None, u'yahoo', u'hello world'])
+
+    def test_bounded(self):
+        urls = ['http://www.google.com/search?q={}'.format(i)
+                for i in range(200)]
+        with SharedResultCache(self.filename, slots=16) as cache:
+            size = os.path.getsize(self.filename)
+            self.assertEqual(_keywords(cache.extract_batch(urls)),
+                             [str(i) for i in range(200)])
+            self.assertEqual(_keywords(cache.extract_batch(urls)),
+                             [str(i) for i in range(200)])
+            self.assertLessEqual(cache.get_stats()['hits'], 16)
+            self.assertEqual(os.path.getsize(self.filename), size)
+
+            long_url = 'http://www.google.com/search?q=' + 'a' * 300
+            self.assertEqual(cache.extract(long_url).keyword, 'a' * 300)
+            self.assertEqual(cache.get_stats()['uncacheable'], 1)
+
+    def test_invalidated_when_engines_change(self):
+        with SharedResultCache(self.filename, slots=64) as cache:
+            cache.extract_batch(REFERRERS)
+
+        digest = serpextract._piwik_digest
+        serpextract._piwik_digest = 'changed'
+        serpextract._engines_version = None
+        try:
+            with SharedResultCache(self.filename) as cache:
+                self.assertEqual(cache.slots, 64)
+                self.assertEqual(cache.get_stats()['invalidated'], 1)
+                cache.extract_batch(REFERRERS)
+                self.assertEqual(cache.get_stats()['misses'], 4)
+        finally:
+            serpextract._piwik_digest = digest
+            serpextract._engines_version = None
+
+
+if __name__ == '__main__':
+    unittest.main()
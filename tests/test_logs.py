@@ -0,0 +1,236 @@
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from StringIO import StringIO
+
+try:
+    from serpextract import logs
+except ImportError:
+    import os, sys
+    basedir = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+    sys.path.append(basedir)
+    from serpextract import logs
+
+
+GOOGLE = 'http://www.google.com/search?q=hello+world'
+
+
+class TestLogAdapters(unittest.TestCase):
+    """Test pulling referrers out of log lines."""
+
+    def test_combined(self):
+        lines = [
+            '1.2.3.4 - - [10/Oct/2013:13:55:36 -0700] "GET /a.html HTTP/1.1" 200 2326 "{}" "Mozilla/5.0 (X11)"\n'.format(GOOGLE),
+            '1.2.3.4 - - [10/Oct/2013:13:55:36 -0700] "GET /a.html HTTP/1.1" 200 2326 "-" "Mozilla/5.0"\n',
+            '1.2.3.4 - - [10/Oct/2013:13:55:36 -0700] "GET /\\"quoted\\" HTTP/1.1" 304 - "http://a.com/\\"b\\"" "curl" "extra"\n',
+            'garbage\n',
+        ]
+        self.assertEqual(list(logs.combined_referrers(lines)),
+                         [GOOGLE, None, 'http://a.com/"b"', None])
+
+    def test_delimited(self):
+        lines = ['2013-10-10\t1.2.3.4\t{}\tMozilla\n'.format(GOOGLE),
+                 '2013-10-10\t1.2.3.4\t-\tMozilla\n',
+                 '2013-10-10\n']
+        self.assertEqual(list(logs.delimited_referrers(lines, 2)),
+                         [GOOGLE, None, None])
+        lines.insert(0, 'date\tip\treferrer\tua\n')
+        self.assertEqual(list(logs.delimited_referrers(lines, 'referrer',
+                                                       header=True)),
+                         [GOOGLE, None, None])
+        self.assertRaisesRegexp(ValueError,
+                                "'ref' column .* date, ip, referrer, ua$",
+                                logs.delimited_referrers, lines, 'ref',
+                                header=True)
+
+    def test_csv(self):
+        lines = ['date,referrer,ua\n',
+                 '2013-10-10,"{}","Mozilla, X11"\n'.format(GOOGLE),
+                 '2013-10-10,,curl\n']
+        self.assertEqual(list(logs.csv_referrers(lines, 'referrer',
+                                                 header=True)),
+                         [GOOGLE, None])
+        self.assertRaisesRegexp(ValueError, "'ref' column .* referrer, ua$",
+                                logs.csv_referrers, lines, 'ref', header=True)
+
+    def test_jsonl(self):
+        lines = [
+            '{{"ip": "1.2.3.4", "referrer": "{}", "ua": "Mozilla"}}\n'.format(GOOGLE),
+            '{"referrer":null}\n',
+            '{"page": "referrer", "referrer": "http:\\/\\/www.bing.com\\/search?q=a"}\n',
+            '{"ip": "1.2.3.4"}\n',
+            'not json\n',
+        ]
+        self.assertEqual(list(logs.jsonl_referrers(lines)),
+                         [GOOGLE, None, 'http://www.bing.com/search?q=a',
+                          None, None])
+
+    def test_extract_referrers(self):
+        referrers = [GOOGLE, None, 'http://www.something.com/', GOOGLE]
+        results = list(logs.extract_referrers(referrers, batch_size=3))
+        self.assertEqual([referrer for referrer, _ in results], referrers)
+        self.assertEqual([res.keyword if res else None for _, res in results],
+                         [u'hello world', None, None, u'hello world'])
+
+    def test_main_output(self):
+        from serpextract import serpextract
+        tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tempdir)
+        filename = os.path.join(tempdir, 'cdn.log')
+        output = os.path.join(tempdir, 'output.csv')
+        with open(filename, 'wb') as f:
+            f.write('a\thttp://www.google.com/search?q=caf%C3%A9\n'
+                    'b\t{}\n'.format(GOOGLE))
+        argv, stdout = sys.argv, sys.stdout
+        sys.argv = ['serpextract', '-f', 'tsv', '--field', '1', filename]
+        # A file, like a pipe, has no encoding for print to use
+        sys.stdout = open(output, 'wb')
+        try:
+            self.assertRaises(SystemExit, serpextract.main)
+        finally:
+            sys.stdout.close()
+            sys.argv, sys.stdout = argv, stdout
+        with open(output, 'rb') as f:
+            self.assertEqual(f.read(), '"Google","caf\xc3\xa9"\n'
+                                       '"Google","hello world"\n')
+
+        # A column missing from the header is a usage error
+        with open(filename, 'wb') as f:
+            f.write('host\treferrer\nb\t{}\n'.format(GOOGLE))
+        argv, stderr = sys.argv, sys.stderr
+        sys.argv = ['serpextract', '-f', 'tsv', '--field', 'ref', filename]
+        sys.stderr = StringIO()
+        try:
+            self.assertRaises(SystemExit, serpextract.main)
+            self.assertIn("error: No 'ref' column in the header, the columns "
+                          "are host, referrer", sys.stderr.getvalue())
+        finally:
+            sys.argv, sys.stderr = argv, stderr
+
+    def test_get_adapter(self):
+        self.assertIs(logs.get_adapter('combined'), logs.combined_referrers)
+        lines = ['a\t{}\n'.format(GOOGLE)]
+        self.assertEqual(list(logs.get_adapter('tsv', '1')(lines)), [GOOGLE])
+        self.assertRaises(ValueError, logs.get_adapter, 'csv')
+        self.assertRaises(ValueError, logs.get_adapter, 'xml')
+
+
+class TestLogFollower(unittest.TestCase):
+    """Test following logs as they're written to and rotated."""
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tempdir, 'access.log')
+        self.checkpoint = os.path.join(self.tempdir, 'offsets.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def write(self, data, mode='ab'):
+        with open(self.filename, mode) as f:
+            f.write(data)
+
+    def test_follow(self):
+        self.write('old\n')
+        with logs.LogFollower([self.filename], self.checkpoint) as follower:
+            self.assertEqual(follower.read(), [])
+            self.write('a\nb')
+            self.assertEqual(follower.read(), ['a\n'])
+            self.assertEqual(follower.get_lag()[0], 1)
+            self.write('\nc\n')
+            self.assertEqual(follower.read(), ['b\n', 'c\n'])
+            follower.commit()
+            self.write('d\n')
+
+        # Carries on from the checkpoint
+        with logs.LogFollower([self.filename], self.checkpoint) as follower:
+            self.assertEqual(follower.read(), ['d\n'])
+
+            # Renamed and replaced, the rest of the old file is read first
+            self.write('e')
+            os.rename(self.filename, self.filename + '.1')
+            self.write('ff\n', 'wb')
+            self.assertEqual(follower.read(), ['e'])
+            self.assertEqual(follower.read(), ['ff\n'])
+
+            # Truncated in place
+            self.write('g\n', 'wb')
+            self.assertEqual(follower.read(), ['g\n'])
+            self.assertEqual(follower.get_lag(), (0, 0.0))
+
+    def test_from_start(self):
+        self.write('a\n')
+        missing = os.path.join(self.tempdir, 'later.log')
+        follower = logs.LogFollower([self.filename, missing], from_start=True)
+        self.assertEqual(follower.read(), ['a\n'])
+        with open(missing, 'wb') as f:
+            f.write('b\n')
+        self.assertEqual(follower.read(), ['b\n'])
+        follower.close()
+
+    def test_follow_referrers(self):
+        follower = logs.LogFollower([self.filename], from_start=True)
+        lines = ['a\t{}\n'.format(GOOGLE), 'b\t-\n',
+                 'c\thttp://www.something.com/\n']
+        self.write(''.join(lines))
+        intervals = logs.follow_referrers(follower, logs.get_adapter('tsv', '1'),
+                                          interval=0, batch_size=2)
+        results, stats = next(intervals)
+        self.assertEqual([(referrer, res.keyword) for referrer, res in results],
+                         [(GOOGLE, u'hello world')])
+        self.assertEqual((stats['lines'], stats['serps'], stats['lag_bytes']),
+                         (3, 1, 0))
+        self.assertEqual(stats['bytes'], len(''.join(lines)))
+        results, stats = next(intervals)
+        self.assertEqual((results, stats['lines']), ([], 0))
+        follower.close()
+
+    def test_follow_output(self):
+        from serpextract import serpextract
+        self.write('a\thttp://www.google.com/search?q=caf%C3%A9\n')
+        output = os.path.join(self.tempdir, 'output.csv')
+        argv, stdout, stderr = sys.argv, sys.stdout, sys.stderr
+        follow_referrers = logs.follow_referrers
+
+        def one_interval(*args):
+            yield next(follow_referrers(*args))
+
+        sys.argv = ['serpextract', '-f', 'tsv', '--field', '1', '--follow',
+                    '--interval', '0.1', '--from-start', '--checkpoint',
+                    self.checkpoint, self.filename]
+        # A file, like a pipe, has no encoding for print to use
+        sys.stdout, sys.stderr = open(output, 'wb'), StringIO()
+        logs.follow_referrers = one_interval
+        try:
+            self.assertRaises(SystemExit, serpextract.main)
+        finally:
+            sys.stdout.close()
+            sys.argv, sys.stdout, sys.stderr = argv, stdout, stderr
+            logs.follow_referrers = follow_referrers
+        with open(output, 'rb') as f:
+            self.assertEqual(f.read(), '"Google","caf\xc3\xa9"\n')
+        # The checkpoint moved past the line that was printed
+        with logs.LogFollower([self.filename], self.checkpoint,
+                              from_start=True) as follower:
+            self.assertEqual(follower.read(), [])
+
+    def test_follow_options(self):
+        from serpextract import serpextract
+        argv, stderr = sys.argv, sys.stderr
+        sys.stderr = StringIO()
+        try:
+            for options in (['--follow'], ['--counts'], ['--interval', '5'],
+                            ['--checkpoint', self.checkpoint], ['--from-start'],
+                            ['-f', 'tsv', '--counts'],
+                            ['-f', 'tsv', '--interval', '5'],
+                            ['-f', 'tsv', '--follow', '--interval', '0']):
+                sys.argv = ['serpextract'] + options + [self.filename]
+                self.assertRaises(SystemExit, serpextract.main)
+        finally:
+            sys.argv, sys.stderr = argv, stderr
+
+
+if __name__ == '__main__':
+    unittest.main()
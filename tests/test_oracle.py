@@ -0,0 +1,32 @@
+import unittest
+
+try:
+    from tests import oracle
+except ImportError:
+    import os, sys
+    basedir = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+    sys.path.append(basedir)
+    from tests import oracle
+
+
+class TestOracle(unittest.TestCase):
+    """Diff every entry point in ``oracle.ENTRY_POINTS`` against the frozen
+    reference implementation over a randomized corpus of referrers."""
+
+    def test_corpus_covers_every_engine(self):
+        urls = oracle.generate_referrers(10)
+        self.assertEqual(urls, oracle.generate_referrers(10))
+        self.assertGreater(len(oracle.generate_referrers(600)), 473)
+
+    def test_no_mismatches(self):
+        urls = oracle.generate_referrers(3000, seed=1)
+        for report in oracle.compare(urls):
+            self.assertEqual(report['mismatches'], [],
+                             '{} differs from the reference on {} of {} '
+                             'referrers, first: {!r}'.format(
+                                report['name'], len(report['mismatches']),
+                                report['calls'], report['mismatches'][:1]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from multiprocessing import Pool
+from multiprocessing.pool import ThreadPool
+
+try:
+    from serpextract.pipeline import imap_extract
+except ImportError:
+    import os, sys
+    basedir = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
+    sys.path.append(basedir)
+    from serpextract.pipeline import imap_extract
+
+
+GOOGLE = 'http://www.google.com/search?q=Hello+World'
+REFERRERS = [GOOGLE, None, 'http://www.something.com/',
+             'http://search.yahoo.com/search?p=yahoo'] * 10
+KEYWORDS = [u'hello world', None, None, u'yahoo'] * 10
+
+
+class TestPipeline(unittest.TestCase):
+    """Test extraction in worker pools."""
+
+    def assertKeywords(self, pairs, keywords):
+        self.assertEqual([referrer for referrer, _ in pairs], REFERRERS)
+        self.assertEqual([res.keyword if res else None for _, res in pairs],
+                         keywords)
+
+    def test_thread_pool(self):
+        self.assertKeywords(list(imap_extract(REFERRERS, chunk_size=3)),
+                            KEYWORDS)
+        pool = ThreadPool(2)
+        try:
+            pairs = list(imap_extract(REFERRERS, pool, chunk_size=7,
+                                      lower_case=False))
+        finally:
+            pool.terminate()
+        self.assertKeywords(pairs, [u'Hello World', None, None, u'yahoo'] * 10)
+
+    def test_many_threads(self):
+        # Enough distinct hosts that the lookup caches evict while workers
+        # share them
+        referrers = ['http://s{}.search.yahoo.com/search?p={}'.format(i, i)
+                     for i in range(20000)]
+        pool = ThreadPool(8)
+        try:
+            pairs = list(imap_extract(referrers, pool, chunk_size=20))
+        finally:
+            pool.terminate()
+        self.assertEqual([res.keyword for _, res in pairs],
+                         [str(i) for i in range(20000)])
+
+    def test_process_pool(self):
+        pool = Pool(2)
+        try:
+            pairs = list(imap_extract(REFERRERS, pool, chunk_size=3))
+        finally:
+            pool.terminate()
+        self.assertKeywords(pairs, KEYWORDS)
+        self.assertEqual(pairs[0][1].engine_name, u'Google')
+        # Results are mutable so duplicate referrers get separate results
+        self.assertIsNot(pairs[0][1], pairs[4][1])
+
+    def test_backpressure(self):
+        read = []
+
+        def producer():
+            for referrer in REFERRERS:
+                read.append(referrer)
+                yield referrer
+
+        pairs = imap_extract(producer(), chunk_size=2, max_in_flight=3)
+        next(pairs)
+        self.assertLessEqual(len(read), 2 * 3)
+        self.assertRaises(ValueError, next,
+                          imap_extract(REFERRERS, max_in_flight=0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,13 +3,15 @@ from urlparse import urlparse
 
 try:
     from serpextract import SearchEngineParser, extract, is_serp,\
-                            get_all_query_params, add_custom_parser
+                            get_all_query_params, add_custom_parser,\
+                            extract_batch, is_serp_batch, BatchPlan
 except ImportError:
     import os, sys
     basedir = os.path.abspath(os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir))
     sys.path.append(basedir)
     from serpextract import SearchEngineParser, extract, is_serp,\
-                            get_all_query_params, add_custom_parser
+                            get_all_query_params, add_custom_parser,\
+                            extract_batch, is_serp_batch, BatchPlan
 
 
 class TestSERPs(unittest.TestCase):
@@ -112,6 +114,121 @@ class TestSERPs(unittest.TestCase):
                              u'test')
         del _engines[u'search.piccshare.com']
 
+    def test_custom_parser_wildcards(self):
+        from serpextract import serpextract
+        rules = (u'*.piccshare.com', u'/piccshare/*', u'?piccshare=*')
+        urls = ['http://search.piccshare.com/search.php?q=test',
+                'http://www.something.com/piccshare/?q=test',
+                'http://www.something.com/?piccshare=1&q=test',
+                'http://piccshare.com/search.php?q=test']
+        for rule in rules:
+            add_custom_parser(rule, self.custom_parser)
+        try:
+            for url in urls[:3]:
+                self.assertValidSERP(url, self.custom_parser.engine_name,
+                                     u'test')
+            self.assertInvalidSERP(urls[3])
+            self.assertEqual([res.keyword if res else None
+                              for res in extract_batch(urls)],
+                             [u'test', u'test', u'test', None])
+            self.assertRaises(ValueError, add_custom_parser,
+                              u'piccshare.*', self.custom_parser)
+        finally:
+            for rule in rules:
+                del serpextract._engines[rule]
+            serpextract._wildcard_index = None
+        self.assertInvalidSERP(urls[0])
+
+    def test_engine_profile(self):
+        import json, os, shutil, tempfile
+        from serpextract import serpextract
+        bing = 'http://www.bing.com/search?q=test'
+        tempdir = tempfile.mkdtemp()
+        filename = os.path.join(tempdir, 'profile.json')
+        try:
+            hits = {u'google.{}': 3, u'bing.com': 1}
+            self.assertEqual(serpextract.save_engine_profile(
+                filename, min_hits=2, rule_hits=hits), 1)
+            with open(filename) as f:
+                self.assertEqual([rule['rule'] for rule in
+                                  json.load(f)['rules']], [u'google.{}'])
+
+            self.assertEqual(serpextract.load_engine_profile(filename),
+                             {u'google.{}': 3})
+            self.assertEqual(len(serpextract._get_search_engines()), 1)
+            self.assertValidSERP('http://www.google.ca/search?q=test',
+                                 u'Google', u'test')
+            self.assertInvalidSERP(bing)
+
+            serpextract.load_engine_profile(filename, fallback=True)
+            fallbacks = serpextract.get_lookup_stats().get('fallback', 0)
+            self.assertValidSERP(bing, u'Bing', u'test')
+            self.assertEqual([res.keyword for res in extract_batch([bing])],
+                             [u'test'])
+            self.assertGreater(serpextract.get_lookup_stats()['fallback'],
+                               fallbacks)
+            self.assertRaises(ValueError, serpextract.load_engine_profile,
+                              os.path.join(os.path.dirname(__file__),
+                                           '__init__.py'))
+        finally:
+            serpextract.unload_engine_profile()
+            shutil.rmtree(tempdir)
+        self.assertValidSERP(bing, u'Bing', u'test')
+
+    def test_engine_profile_version(self):
+        """Caches are invalidated when search_engines.pickle changes if a
+        profile falls back to it."""
+        import os, shutil, tempfile
+        from serpextract import serpextract
+        tempdir = tempfile.mkdtemp()
+        filename = os.path.join(tempdir, 'profile.json')
+        digest = serpextract._piwik_digest
+        try:
+            serpextract.save_engine_profile(filename,
+                                            rule_hits={u'google.{}': 1})
+            for fallback in (False, True):
+                serpextract.load_engine_profile(filename, fallback=fallback)
+                version = serpextract._get_engines_version()
+                serpextract._piwik_digest = 'changed'
+                serpextract._engines_version = None
+                self.assertEqual(serpextract._get_engines_version() != version,
+                                 fallback)
+                serpextract._piwik_digest = digest
+        finally:
+            serpextract._piwik_digest = digest
+            serpextract.unload_engine_profile()
+            shutil.rmtree(tempdir)
+
+    def test_get_serp_urls(self):
+        from serpextract import get_parser, get_serp_urls
+        google = get_parser('http://www.google.ca/search?q=test')
+        keyword = u'caf\xe9 a&b/c'
+        rows = [
+            (google, 'http://www.google.ca', keyword),
+            (u'poisk.ru', 'http://poisk.ru', u'\u043f\u0440\u0438'),
+            (u'zoohoo.cz', 'http://zoohoo.cz', u'\u4f60 \xe4'),
+            (u'www.gomeo.com', 'http://www.gomeo.com/', u'a b'),
+            (u'szukaj.wp.pl', 'http://www.wp.pl', u'x'),
+            (None, 'http://www.google.ca', keyword),
+            (google, 'http://www.google.ca', None),
+            (google, 'http://www.google.ca', keyword),
+        ]
+        links = get_serp_urls(*zip(*rows))
+        self.assertEqual(links, [
+            u'http://www.google.ca/search?q=caf%C3%A9+a%26b%2Fc',
+            u'http://poisk.ru/cgi-bin/poisk?text=%EF%F0%E8',
+            u'http://zoohoo.cz/?q=%E4%BD%A0+%C3%A4',
+            u'http://www.gomeo.com/search/a%20b',
+            u'http://szukaj.wp.pl/szukaj.html?szukaj=x',
+            None,
+            None,
+            links[0],
+        ])
+        self.assertEqual(get_serp_urls([google], ['http://www.google.ca'],
+                                       [u'test']),
+                         [google.get_serp_url('http://www.google.ca',
+                                              u'test')])
+
     def test_naive_detection(self):
         self.assertInvalidSERP(self.custom_serp_url)
         self.assertValidSERP(self.custom_serp_url, u'piccshare', u'test', use_naive_method=True)
@@ -126,6 +243,46 @@ class TestSERPs(unittest.TestCase):
         self.assertIsInstance(params, list)
         self.assertGreater(len(params), 0)
 
+    def test_extract_batch(self):
+        urls = [
+            'http://www.google.com/search?q=one',
+            'http://www.something.com/',
+            'http://www.google.com/search?q=TWO',
+            'http://www.google.com/cse?cx=partner-pub-1&q=three',
+            'http://www.bing.com/search?q=four',
+            'http://www.something.com/?cx=partner-pub-1&q=five',
+            'http://www.something.com/?q=six',
+            'http://www.yahoo.com/#/%C2%BF??;%C2%AB99555$&&&4&',
+        ]
+        expected = [extract(url) for url in urls]
+        results = extract_batch(urls)
+        self.assertEqual([(r.engine_name, r.keyword) if r else None for r in results],
+                         [(r.engine_name, r.keyword) if r else None for r in expected])
+        self.assertEqual(results[5].engine_name, u'Google Custom Search')
+        self.assertIsNone(results[6])
+
+        plan = BatchPlan(urls)
+        self.assertEqual(len(plan), len(urls))
+        self.assertEqual(len(plan.groups), 5)
+        self.assertAlmostEqual(plan.dedupe_ratio, 8 / 5.0)
+
+    def test_is_serp_batch(self):
+        urls = [
+            'http://www.google.com/search?q=one',
+            'http://www.something.com/',
+            'https://www.google.com/',
+            'http://www.google.com/search?tbm=isch',
+            'http://www.google.com/search?tbm=vid',
+            'http://duckduckgo.com/',
+            'http://www.bing.com/search?form=QBLH',
+            self.custom_serp_url,
+        ]
+        expected = [True, False, True, True, False, True, False, False]
+        self.assertEqual([is_serp(url) for url in urls], expected)
+        self.assertEqual(is_serp_batch(urls), expected)
+        expected[-1] = True
+        self.assertEqual(is_serp_batch(urls, use_naive_method=True), expected)
+
     def test_invalid_serps(self):
         invalid_serps = (
             'http://www.google.com/reader',